@@ -1,28 +1,86 @@
 import os
 from dotenv import load_dotenv
 
-load_dotenv()
+# Защита от повторного разбора .env при перезагрузке модуля
+if not globals().get('_DOTENV_LOADED'):
+    load_dotenv()
+    _DOTENV_LOADED = True
+
+
+def _env_int(name, default):
+    """Прочитать целое число из переменной окружения"""
+    value = os.environ.get(name)
+    return default if value is None else int(value)
+
+
+def _env_float(name, default):
+    """Прочитать число с плавающей точкой из переменной окружения"""
+    value = os.environ.get(name)
+    return default if value is None else float(value)
+
+
+def _env_bool(name, default):
+    """Прочитать флаг из переменной окружения (1/true/yes/on - включено)"""
+    value = os.environ.get(name)
+    return default if value is None else value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# Учетные данные Telegram API
+TELEGRAM_API_ID = os.environ.get('TELEGRAM_API_ID')
+TELEGRAM_API_HASH = os.environ.get('TELEGRAM_API_HASH')
+TELEGRAM_PHONE = os.environ.get('TELEGRAM_PHONE')
+
+# Telegram Bot Token
+BOT_TOKEN = os.environ.get('BOT_TOKEN')
+
+# Список каналов для анализа (разделенных запятыми)
+CHANNELS_LIST = os.environ.get('CHANNELS_LIST', '@yourchannel')  # Например: "@channel1,@channel2,@channel3"
+CHANNELS = tuple(ch.strip() for ch in CHANNELS_LIST.split(',') if ch.strip())
+
+# Настройки анализа
+MAX_MESSAGES = _env_int('MAX_MESSAGES', 100)
+NEGATIVE_COMMENT_THRESHOLD = _env_float('NEGATIVE_COMMENT_THRESHOLD', 0.3)  # 30% негативных комментариев для определения негативного поста
+SENTIMENT_BATCH_SIZE = _env_int('SENTIMENT_BATCH_SIZE', 0)  # Размер пакета текстов для модели настроений (0 - по устройству: 64 CPU, 128 GPU)
+SENTIMENT_CACHE_SIZE = _env_int('SENTIMENT_CACHE_SIZE', 10000)  # Сколько оценок уникальных текстов хранить в памяти (0 - без кеша)
+MAX_SEQ_LEN = _env_int('MAX_SEQ_LEN', 128)  # Максимальная длина текста в токенах для модели настроений
+MIN_SENTIMENT_LEN = _env_int('MIN_SENTIMENT_LEN', 3)  # Более короткие тексты и тексты без букв считаются нейтральными (0 - отключить)
+TORCH_NUM_THREADS = _env_int('TORCH_NUM_THREADS', 1)  # Потоки torch на CPU (0 - значение torch по умолчанию)
+TORCH_COMPILE = _env_bool('TORCH_COMPILE', False)  # Компилировать модель настроений через torch.compile
+TORCH_QUANTIZE = _env_bool('TORCH_QUANTIZE', True)  # int8-квантование Linear-слоев модели при работе на CPU
+
+# Настройки вывода
+OUTPUT_DIR = os.environ.get('OUTPUT_DIR', 'output')
+
+# Постоянный кеш оценок настроений (SQLite); пустая строка отключает кеш
+SENTIMENT_CACHE_PATH = os.environ.get('SENTIMENT_CACHE_PATH', os.path.join(OUTPUT_DIR, 'sentiment_cache.sqlite3'))
+
 
 class Config:
-    # Учетные данные Telegram API
-    TELEGRAM_API_ID = os.getenv('TELEGRAM_API_ID')
-    TELEGRAM_API_HASH = os.getenv('TELEGRAM_API_HASH')
-    TELEGRAM_PHONE = os.getenv('TELEGRAM_PHONE')
+    """Пространство имен настроек; значения вычисляются один раз на уровне модуля"""
+    __slots__ = ()
+    
+    TELEGRAM_API_ID = TELEGRAM_API_ID
+    TELEGRAM_API_HASH = TELEGRAM_API_HASH
+    TELEGRAM_PHONE = TELEGRAM_PHONE
     
-    # Telegram Bot Token
-    BOT_TOKEN = os.getenv('BOT_TOKEN')
+    BOT_TOKEN = BOT_TOKEN
     
-    # Список каналов для анализа (разделенных запятыми)
-    CHANNELS_LIST = os.getenv('CHANNELS_LIST', '@yourchannel')  # Например: "@channel1,@channel2,@channel3"
+    CHANNELS_LIST = CHANNELS_LIST
     
-    @classmethod
-    def get_channels_list(cls):
-        """Получить список каналов для анализа"""
-        return [ch.strip() for ch in cls.CHANNELS_LIST.strip().split(',') if ch.strip()]
+    @staticmethod
+    def get_channels_list():
+        """Получить список каналов для анализа (неизменяемый кортеж)"""
+        return CHANNELS
     
-    # Настройки анализа
-    MAX_MESSAGES = int(os.getenv('MAX_MESSAGES', 100))
-    NEGATIVE_COMMENT_THRESHOLD = float(os.getenv('NEGATIVE_COMMENT_THRESHOLD', 0.3))  # 30% негативных комментариев для определения негативного поста
+    MAX_MESSAGES = MAX_MESSAGES
+    NEGATIVE_COMMENT_THRESHOLD = NEGATIVE_COMMENT_THRESHOLD
+    SENTIMENT_BATCH_SIZE = SENTIMENT_BATCH_SIZE
+    SENTIMENT_CACHE_SIZE = SENTIMENT_CACHE_SIZE
+    MAX_SEQ_LEN = MAX_SEQ_LEN
+    MIN_SENTIMENT_LEN = MIN_SENTIMENT_LEN
+    TORCH_NUM_THREADS = TORCH_NUM_THREADS
+    TORCH_COMPILE = TORCH_COMPILE
+    TORCH_QUANTIZE = TORCH_QUANTIZE
     
-    # Настройки вывода
-    OUTPUT_DIR = os.getenv('OUTPUT_DIR', 'output')
+    OUTPUT_DIR = OUTPUT_DIR
+    SENTIMENT_CACHE_PATH = SENTIMENT_CACHE_PATH
@@ -1,10 +1,20 @@
+import argparse
 import os
 import sys
-import glob
-from datetime import datetime
+from fnmatch import fnmatch
 from logging_config import LoggingConfig
 
 
+# Текущий лог и его ротированные копии (news_analyzer.log.1, .log.2, ...)
+LIVE_LOG_PATTERN = "*.log"
+ROTATED_LOG_PATTERN = "*.log.[0-9]*"
+
+
+def is_log_file_name(name):
+    """Проверить, является ли имя файла логом или его ротированной копией"""
+    return fnmatch(name, LIVE_LOG_PATTERN) or fnmatch(name, ROTATED_LOG_PATTERN)
+
+
 def show_log_status():
     """Отобразить статус логов"""
     print("📊 Статус файлов логов")
@@ -22,13 +32,63 @@ def show_log_status():
     print("   Директория существует: {}".format(os.path.exists(LoggingConfig.LOG_DIR)))
     
     if os.path.exists(LoggingConfig.LOG_DIR):
-        log_files = glob.glob(os.path.join(LoggingConfig.LOG_DIR, "*.log*"))
+        # scandir отдает закешированный тип файла, поэтому на файл нужен один stat
+        with os.scandir(LoggingConfig.LOG_DIR) as it:
+            log_files = [entry for entry in it if is_log_file_name(entry.name)]
         print("   Всего файлов лога: {}".format(len(log_files)))
         
-        total_size = sum(os.path.getsize(f) for f in log_files if os.path.isfile(f))
+        total_size = sum(entry.stat().st_size for entry in log_files if entry.is_file(follow_symlinks=False))
         print("   Общий размер: {:.2f} MB".format(total_size / (1024*1024)))
 
 
+TAIL_BLOCK_SIZE = 64 * 1024
+
+
+def read_tail(file_path, lines=20):
+    """
+    Прочитать последние N строк файла, читая его блоками с конца
+    
+    Args:
+        file_path: Путь к файлу
+        lines: Количество строк
+    
+    Returns:
+        Список последних строк без символов перевода строки
+    """
+    if lines <= 0:
+        return []
+    
+    with open(file_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        pos = f.tell()
+        
+        # Один буфер на все чтения, блоки копим в обратном порядке
+        buf = bytearray(TAIL_BLOCK_SIZE)
+        view = memoryview(buf)
+        chunks = []
+        newlines = 0
+        
+        # Читаем блоки с конца, пока не наберем lines + 1 переводов строки
+        while pos > 0 and newlines <= lines:
+            read_size = min(TAIL_BLOCK_SIZE, pos)
+            pos -= read_size
+            f.seek(pos)
+            nread = f.readinto(view[:read_size])
+            chunk = bytes(view[:nread])
+            newlines += chunk.count(b'\n')
+            chunks.append(chunk)
+    
+    # Делим только по '\n', как и при подсчете блоков: splitlines разбил бы строку
+    # и по другим символам (\x0c, \x85, \u2028...), вытесняя настоящие строки из хвоста
+    text = b''.join(reversed(chunks)).decode('utf-8', errors='replace')
+    if '\r' in text:
+        text = text.replace('\r\n', '\n')
+    tail = text.split('\n')
+    if tail[-1] == '':
+        tail.pop()
+    return tail[-lines:]
+
+
 def tail_log(lines=20):
     """Показать последние N строк лога"""
     log_file = LoggingConfig.LOG_FILE
@@ -41,12 +101,10 @@ def tail_log(lines=20):
     print("=" * 60)
     
     try:
-        with open(log_file, 'r') as f:
-            all_lines = f.readlines()
-            last_lines = all_lines[-lines:] if len(all_lines) > lines else all_lines
-            
-            for line in last_lines:
-                print(line.rstrip())
+        tail = read_tail(log_file, lines)
+        if tail:
+            # Выводим хвост одной записью вместо print на каждую строку
+            sys.stdout.write('\n'.join(tail) + '\n')
                 
     except Exception as e:
         print("❌ Ошибка чтения файла лога: {}".format(e))
@@ -54,61 +112,90 @@ def tail_log(lines=20):
 
 def clear_logs():
     """Очистить файл лога"""
-    log_file = LoggingConfig.LOG_FILE
+    log_dir = LoggingConfig.LOG_DIR
+    live_name = os.path.basename(LoggingConfig.LOG_FILE)
     
     cleared_count = 0
     
-    if os.path.exists(log_file):
+    if os.path.isdir(log_dir):
+        # Удаляем текущий и ротированные логи за один проход по директории,
+        # относительно открытого дескриптора директории (где это поддерживается)
+        dir_fd = None
+        if os.unlink in os.supports_dir_fd:
+            dir_fd = os.open(log_dir, os.O_RDONLY | os.O_DIRECTORY)
+        
         try:
-            os.remove(log_file)
-            print("✅ Очищено: {}".format(os.path.basename(log_file)))
-            cleared_count += 1
-        except Exception as e:
-            print("❌ Ошибка очистки {}: {}".format(os.path.basename(log_file), e))
-    
-    # Clear rotated log files
-    if os.path.exists(LoggingConfig.LOG_DIR):
-        rotated_files = glob.glob(os.path.join(LoggingConfig.LOG_DIR, "*.log.*"))
-        for rot_file in rotated_files:
-            try:
-                os.remove(rot_file)
-                print("✅ Очищено: {}".format(os.path.basename(rot_file)))
-                cleared_count += 1
-            except Exception as e:
-                print("❌ Ошибка очистки {}: {}".format(os.path.basename(rot_file), e))
+            with os.scandir(log_dir) as it:
+                for entry in it:
+                    if entry.name != live_name and not fnmatch(entry.name, ROTATED_LOG_PATTERN):
+                        continue
+                    try:
+                        if dir_fd is not None:
+                            os.unlink(entry.name, dir_fd=dir_fd)
+                        else:
+                            os.remove(entry.path)
+                        print("✅ Очищено: {}".format(entry.name))
+                        cleared_count += 1
+                    except Exception as e:
+                        print("❌ Ошибка очистки {}: {}".format(entry.name, e))
+        finally:
+            if dir_fd is not None:
+                os.close(dir_fd)
     
     print("\n📊 Всего очищено: {}".format(cleared_count))
 
 
-def main():
+def _confirm_and_clear(args):
+    """Очистить логи после подтверждения (или сразу с --yes)"""
+    if not args.yes:
+        confirm = input("⚠️  Вы уверены, что хотите очистить файл лога? (y/N): ")
+        if confirm.lower() != 'y':
+            print("❌ Операция отменена")
+            return
+    clear_logs()
+
+
+COMMANDS = {
+    'status': lambda args: show_log_status(),
+    'tail': lambda args: tail_log(args.lines),
+    'clear': _confirm_and_clear,
+}
+
+
+def build_parser():
+    """Построить парсер аргументов командной строки"""
+    parser = argparse.ArgumentParser(
+        prog="python log_utils.py",
+        description="📝 News Analyzer - Утилиты для работы с логами",
+        epilog="Пример: python log_utils.py tail 50"
+    )
+    subparsers = parser.add_subparsers(dest='command', title="Команды")
+    
+    subparsers.add_parser('status', help="Показать статус файла лога")
+    
+    tail_parser = subparsers.add_parser('tail', help="Показать последние N строк лога")
+    tail_parser.add_argument('lines', nargs='?', type=int, default=20, help="Количество строк (по умолчанию 20)")
+    
+    clear_parser = subparsers.add_parser('clear', help="Очистить файл лога")
+    clear_parser.add_argument('-y', '--yes', action='store_true', help="Не запрашивать подтверждение")
+    
+    return parser
+
+
+def main(argv=None):
     """Основной CLI интерфейс"""
-    if len(sys.argv) < 2:
-        print("📝 News Analyzer - Утилиты для работы с логами")
-        print("\nКоманды:")
-        print("  python log_utils.py status         - Показать статус файла лога")
-        print("  python log_utils.py tail N   - Показать последние N строк лога")
-        print("  python log_utils.py clear          - Очистить файл лога")
-        print("\nПример: python log_utils.py tail 50")
-        return
+    parser = build_parser()
+    # Команды, как и раньше, не зависят от регистра (STATUS == status)
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv:
+        argv[0] = argv[0].lower()
+    args = parser.parse_args(argv)
     
-    command = sys.argv[1].lower()
+    if args.command is None:
+        parser.print_help()
+        return
     
-    if command == "status":
-        show_log_status()
-        
-    elif command == "tail":
-        lines = int(sys.argv[2]) if len(sys.argv) > 2 else 20
-        tail_log(lines)
-        
-    elif command == "clear":
-        confirm = input("⚠️  Вы уверены, что хотите очистить файл лога? (y/N): ")
-        if confirm.lower() == 'y':
-            clear_logs()
-        else:
-            print("❌ Операция отменена")
-            
-    else:
-        print("❌ Неизвестная команда: {}".format(command))
+    COMMANDS[args.command](args)
 
 
 if __name__ == "__main__":
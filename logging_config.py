@@ -1,9 +1,57 @@
+import atexit
 import logging
 import logging.handlers
 import os
+import queue
 from datetime import datetime
 
 
+class BufferedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """
+    RotatingFileHandler с буферизованной записью в файл
+    
+    Записи копятся в буфере и сбрасываются на диск при его заполнении или
+    на сообщениях уровня WARNING и выше. Размер файла для ротации считается
+    в байтах по записанным данным, без stat/seek на каждое сообщение.
+    """
+    BUFFER_SIZE = 64 * 1024
+    FLUSH_LEVEL = logging.WARNING
+    
+    def _open(self):
+        stream = open(self.baseFilename, self.mode, buffering=self.BUFFER_SIZE,
+                      encoding=self.encoding, errors=self.errors)
+        self._size = os.fstat(stream.fileno()).st_size
+        return stream
+    
+    def _encoded_len(self, msg):
+        """Размер записи в байтах в кодировке файла (с завершающим переводом строки)"""
+        return len((msg + self.terminator).encode(self.encoding or 'utf-8', self.errors or 'strict'))
+    
+    def shouldRollover(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        if self.maxBytes <= 0 or not self._size:
+            return False
+        return self._size + self._encoded_len(self.format(record)) >= self.maxBytes
+    
+    def emit(self, record):
+        try:
+            msg = self.format(record)
+            if self.stream is None:
+                self.stream = self._open()
+            size = self._encoded_len(msg)
+            if self.maxBytes > 0 and self._size and self._size + size >= self.maxBytes:
+                self.doRollover()
+            self.stream.write(msg + self.terminator)
+            self._size += size
+            if record.levelno >= self.FLUSH_LEVEL:
+                self.stream.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+
 class LoggingConfig:
     LOG_DIR = os.path.join(os.path.dirname(__file__), "logs")
     
@@ -12,6 +60,74 @@ class LoggingConfig:
     LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
     
+    # Ротация лога: макс. 10MB на файл, 5 резервных копий
+    LOG_MAX_BYTES = 10 * 1024 * 1024
+    LOG_BACKUP_COUNT = 5
+    
+    # Общие обработчики и фоновые слушатели очереди (по набору обработчиков)
+    _file_handler = None
+    _console_handler = None
+    _listeners = {}
+    
+    _dir_ready = False
+    
+    # Кеш get_log_files_info: имя -> ((путь, mtime_ns, размер), данные)
+    _info_cache = {}
+    
+    @classmethod
+    def _ensure_dir(cls):
+        """Создать директорию логов (проверка выполняется один раз за процесс)"""
+        if not cls._dir_ready:
+            os.makedirs(cls.LOG_DIR, exist_ok=True)
+            cls._dir_ready = True
+    
+    @classmethod
+    def _get_log_queue(cls, log_to_file, log_to_console):
+        """
+        Получить очередь логов, которую обслуживает фоновый поток
+        
+        Запись в файл и консоль выполняет QueueListener, поэтому вызовы
+        logger.* в обработчиках бота не блокируются на дисковом I/O.
+        """
+        key = (log_to_file, log_to_console)
+        listener = cls._listeners.get(key)
+        if listener is not None:
+            return listener.queue
+        
+        formatter = logging.Formatter(cls.LOG_FORMAT, cls.DATE_FORMAT)
+        handlers = []
+        
+        if log_to_file:
+            if cls._file_handler is None:
+                # Один файл лога с ротацией и буферизованной записью
+                cls._file_handler = BufferedRotatingFileHandler(
+                    cls.LOG_FILE,
+                    maxBytes=cls.LOG_MAX_BYTES,
+                    backupCount=cls.LOG_BACKUP_COUNT,
+                    encoding='utf-8'
+                )
+                cls._file_handler.setFormatter(formatter)
+            handlers.append(cls._file_handler)
+        
+        # Пишем лог в консоль
+        if log_to_console:
+            if cls._console_handler is None:
+                cls._console_handler = logging.StreamHandler()
+                cls._console_handler.setFormatter(formatter)
+            handlers.append(cls._console_handler)
+        
+        listener = logging.handlers.QueueListener(queue.Queue(-1), *handlers, respect_handler_level=True)
+        listener.start()
+        cls._listeners[key] = listener
+        return listener.queue
+    
+    @classmethod
+    def stop_listeners(cls):
+        """Остановить фоновые слушатели, дописав оставшиеся в очереди записи"""
+        for listener in cls._listeners.values():
+            listener.stop()
+        cls._listeners.clear()
+    
     @classmethod
     def setup_logging(cls, logger_name=None, log_to_file=True, log_to_console=True):
         """
@@ -25,33 +141,30 @@ class LoggingConfig:
         Returns:
             Настроенный экземпляр логгера
         """
-        # Create logs directory if it doesn't exist
-        if not os.path.exists(cls.LOG_DIR):
-            os.makedirs(cls.LOG_DIR)
+        cls._ensure_dir()
         
         logger = logging.getLogger(logger_name)
         
-        logger.handlers = []
-        
-        logger.setLevel(logging.DEBUG)
+        log_queue = None
+        if log_to_file or log_to_console:
+            log_queue = cls._get_log_queue(log_to_file, log_to_console)
         
-        formatter = logging.Formatter(cls.LOG_FORMAT, cls.DATE_FORMAT)
+        # Повторная настройка с теми же параметрами оставляет обработчики как есть
+        already_configured = (
+            len(logger.handlers) == (1 if log_queue is not None else 0)
+            and all(getattr(h, 'queue', None) is log_queue for h in logger.handlers)
+        )
         
-        if log_to_file:
-            # Один файл лога с ротацией (макс. 10MB, с бекпом из 5 файлов)
-            file_handler = logging.handlers.RotatingFileHandler(
-                cls.LOG_FILE,
-                maxBytes=10*1024*1024,  # 10MB
-                backupCount=5
-            )
-            file_handler.setFormatter(formatter)
-            logger.addHandler(file_handler)
+        if not already_configured:
+            # Закрываем прежние обработчики явно, чтобы сразу освободить файловые дескрипторы
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+                handler.close()
+            
+            if log_queue is not None:
+                logger.addHandler(logging.handlers.QueueHandler(log_queue))
         
-        # Пишем лог в консоль
-        if log_to_console:
-            console_handler = logging.StreamHandler()
-            console_handler.setFormatter(formatter)
-            logger.addHandler(console_handler)
+        logger.setLevel(logging.DEBUG)
         
         # Предотвращаем распространение лога в root логгер, чтобы избежать дублирования сообщений
         logger.propagate = False
@@ -66,35 +179,7 @@ class LoggingConfig:
         Returns:
             Настроенный экземпляр логгера для бота
         """
-        if not os.path.exists(cls.LOG_DIR):
-            os.makedirs(cls.LOG_DIR)
-        
-        logger = logging.getLogger('telegram_bot')
-        
-        logger.handlers = []
-        
-        logger.setLevel(logging.DEBUG)
-        
-        formatter = logging.Formatter(cls.LOG_FORMAT, cls.DATE_FORMAT)
-        
-        # Один файл лога с ротацией (макс. 10MB, с бекпом из 5 файлов)
-        file_handler = logging.handlers.RotatingFileHandler(
-            cls.LOG_FILE,
-            maxBytes=10*1024*1024,  # 10MB
-            backupCount=5
-        )
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-        
-        # Пишем лог в консоль
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        logger.addHandler(console_handler)
-        
-        # Предотвращаем распространение лога в root логгер, чтобы избежать дублирования сообщений
-        logger.propagate = False
-        
-        return logger
+        return cls.setup_logging(logger_name='telegram_bot', log_to_file=True, log_to_console=True)
     
     @classmethod
     def get_log_files_info(cls):
@@ -111,23 +196,42 @@ class LoggingConfig:
         ]
         
         for name, file_path in log_files:
-            if os.path.exists(file_path):
+            # Один stat на файл; если файл не менялся, берем готовые данные из кеша
+            try:
                 stat = os.stat(file_path)
-                info[name] = {
+                cache_key = (file_path, stat.st_mtime_ns, stat.st_size)
+            except FileNotFoundError:
+                stat = None
+                cache_key = (file_path, None, None)
+            
+            cached = cls._info_cache.get(name)
+            if cached is not None and cached[0] == cache_key:
+                info[name] = cached[1]
+                continue
+            
+            if stat is not None:
+                details = {
                     'path': file_path,
                     'size_mb': round(stat.st_size / (1024*1024), 2),
                     'modified': datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S')
                 }
             else:
-                info[name] = {
+                details = {
                     'path': file_path,
                     'size_mb': 0,
                     'modified': 'Not created yet'
                 }
+            
+            cls._info_cache[name] = (cache_key, details)
+            info[name] = details
         
         return info
 
 
+# Дописываем очередь логов до того, как logging.shutdown закроет обработчики
+atexit.register(LoggingConfig.stop_listeners)
+
+
 def setup_logger(name=None, file_logging=True, console_logging=True):
     """
     Быстрая настройка логгера
@@ -1,12 +1,14 @@
-import os
-from telegram_bot import NegativePostsBot
+from config import Config
 
 if __name__ == "__main__":
-    bot_token = os.getenv('BOT_TOKEN')
+    bot_token = Config.BOT_TOKEN
     if not bot_token:
         print("❌ Переменная окружения BOT_TOKEN не установлена")
         print("Добавьте BOT_TOKEN=your_bot_token в .env файл")
         exit(1)
     
+    # Тяжелые зависимости (telegram, transformers, torch) импортируем только при валидной конфигурации
+    from telegram_bot import NegativePostsBot
+    
     bot = NegativePostsBot(bot_token)
     bot.run()
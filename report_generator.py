@@ -1,231 +1,116 @@
-import json
+import heapq
 import os
 import re
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import List, Dict, Iterable, Iterator
 from datetime import datetime
+import orjson
 from config import Config
 from logging_config import setup_logger
 
 logger = setup_logger(__name__)
 
+# Все пробельные символы (то же множество, что \s в re) заменяются обычным пробелом
+_WS_TRANS = str.maketrans(dict.fromkeys(
+    '\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f\x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004'
+    '\u2005\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000',
+    ' '
+))
+_MULTI_SPACE_RE = re.compile(r' {2,}')
+
+_get_is_negative = itemgetter('is_negative')
+
+# Общий пустой словарь для значений по умолчанию, чтобы не создавать новый на каждый пост
+_EMPTY = {}
+
+
 def clean_text_preview(text: str, max_length: int = 200) -> str:
     """Очищаем и форматируем текст, удаляя переносы строк и нормализуя пробелы"""
     if not text:
         return ""
     
-    clean_text = text.replace('\n', ' ').replace('\r', ' ').strip()
-    clean_text = re.sub(r'\s+', ' ', clean_text)
+    # Один проход translate вместо цепочки replace (не нужен, если из пробельных символов есть только пробел);
+    # регулярное выражение нужно, только если есть двойные пробелы
+    clean_text = (text if text.isprintable() else text.translate(_WS_TRANS)).strip()
+    if '  ' in clean_text:
+        clean_text = _MULTI_SPACE_RE.sub(' ', clean_text)
     return clean_text[:max_length] + '...' if len(clean_text) > max_length else clean_text
 
 
-class ReportGenerator:
-    def __init__(self, output_dir: str = None):
-        self.output_dir = output_dir or Config.OUTPUT_DIR
-        os.makedirs(self.output_dir, exist_ok=True)
-    
-    def generate_multichannel_negative_posts_report(self, messages: List[Dict], max_posts: int = 100, output_dir: str = None) -> Dict:
-        """
-        Генерация отчета для негативных постов, сгруппированных по каналам.
-        
-        Args:
-            messages: Список аназированных сообщений с данными о настроении (включая информацию о канале)
-            max_posts: Максимальное количество постов на канал
-            output_dir: Пользовательская директория вывода (опционально)
-            
-        Returns:
-            Словарь с путями к сгенерированным файлам и статистикой по каналам
-        """
-        logger.info(f"Generating report for negative posts, grouped by channels. Maximum number of posts per channel: {max_posts}")
-        
-        channels_data = {}
-        total_messages = 0
-        total_negative = 0
-        
-        for msg in messages:
-            channel = msg.get('channel', '@unknown')
-            
-            if channel not in channels_data:
-                channels_data[channel] = {
-                    'channel_title': msg.get('channel_title', channel),
-                    'messages': [],
-                    'negative_posts': []
-                }
-            
-            channels_data[channel]['messages'].append(msg)
-            total_messages += 1
-            
-            if msg.get('is_negative', False):
-                total_negative += 1
-                
-                # Форматируем сообщение для отчета
-                comments = msg.get('comments', [])
-                total_comments = len(comments)
-                negative_comments = sum(1 for c in comments if c.get('is_negative', False))
-                negative_comment_percentage = (negative_comments / total_comments * 100) if total_comments > 0 else 0
-                
-                post_date = msg.get('date')
-                if hasattr(post_date, 'strftime'):
-                    formatted_date = post_date.strftime('%Y-%m-%d %H:%M:%S')
-                else:
-                    formatted_date = str(post_date)
-                
-                post_data = {
-                    'id': msg.get('id'),
-                    'date': formatted_date,
-                    'text': msg.get('text', ''),
-                    'negative_score': round(msg.get('sentiment', {}).get('negative', 0), 4),
-                    'total_comments': total_comments,
-                    'negative_comments': negative_comments,
-                    'negative_comment_percentage': round(negative_comment_percentage, 2),
-                    'views': msg.get('views', 0),
-                    'forwards': msg.get('forwards', 0),
-                    'replies': msg.get('replies', 0),
-                    'channel': channel,
-                    'channel_title': msg.get('channel_title', channel)
-                }
-                
-                channels_data[channel]['negative_posts'].append(post_data)
-        
-        # Сортируем негативные посты по оценке в каждом канале и ограничиваем количество
-        for channel_info in channels_data.values():
-            channel_info['negative_posts'].sort(key=lambda x: x['negative_score'], reverse=True)
-            channel_info['negative_posts'] = channel_info['negative_posts'][:max_posts]
-        
-        if output_dir is None:
-            report_timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            output_dir = os.path.join(self.output_dir, f"multichannel_negative_posts_{report_timestamp}")
-        
-        os.makedirs(output_dir, exist_ok=True)
-        
-        # Генерируем JSON отчет с многоканальной структурой
-        json_data = {
-            'metadata': {
-                'timestamp': datetime.now().isoformat(),
-                'generated_at': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'total_channels': len(channels_data),
-                'total_messages': total_messages,
-                'total_negative': total_negative,
-                'negative_percentage': round((total_negative / total_messages * 100) if total_messages > 0 else 0, 1)
-            },
-            'channels': {}
-        }
-        
-        # Добавляем данные канала в JSON
-        for channel, channel_info in channels_data.items():
-            negative_count = len(channel_info['negative_posts'])
-            total_count = len(channel_info['messages'])
-            json_data['channels'][channel] = {
-                'channel_title': channel_info['channel_title'],
-                'total_messages': total_count,
-                'negative_posts_count': negative_count,
-                'negative_percentage': round((negative_count / total_count * 100) if total_count > 0 else 0, 1),
-                'negative_posts': channel_info['negative_posts']
-            }
-        
-        json_path = os.path.join(output_dir, "multichannel_negative_posts.json")
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(json_data, f, indent=2, ensure_ascii=False)
-        
-        # Генерируем HTML отчет
-        html_path = os.path.join(output_dir, "multichannel_negative_posts.html")
-        html_content = self._create_multichannel_html_report(channels_data, total_messages, total_negative)
-        
-        with open(html_path, 'w', encoding='utf-8') as f:
-            f.write(html_content)
-        
-        result = {
-            'output_dir': output_dir,
-            'html_path': html_path,
-            'posts_count': total_negative,
-            'json_path': json_path,
-            'channels_data': channels_data,
-            'total_messages': total_messages,
-            'total_negative': total_negative,
-        }
-        return result
-        
-    def _create_html_report(self, negative_posts: List[Dict]) -> str:
-        """Создаем простой HTML шаблон для отчета о негативных постах"""
-        
-        # Получаем имя канала из конфига для генерации ссылки
-        channel_username = ""
-        
-        html = f"""<!DOCTYPE html>
-        <html lang="ru">
-        <head>
-            <meta charset="UTF-8">
-            <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Топ {len(negative_posts)} негативных постов</title>
-            <style>
-        body {{ 
+# Статическая разметка HTML-отчетов. Собирается один раз при импорте модуля,
+# а не разбирается заново в f-строке при каждой генерации отчета.
+_SINGLE_REPORT_CSS = """
+        body { 
             font-family: Arial, sans-serif; 
             margin: 20px; 
             background-color: #f8f9fa; 
             line-height: 1.6;
-        }}
-        .container {{ 
+        }
+        .container { 
             max-width: 1200px; 
             margin: 0 auto; 
             background-color: white; 
             padding: 20px; 
             border-radius: 8px; 
             box-shadow: 0 2px 10px rgba(0,0,0,0.1); 
-        }}
-        h1 {{ 
+        }
+        h1 { 
             color: #dc3545; 
             text-align: center; 
             margin-bottom: 30px; 
             border-bottom: 3px solid #dc3545;
             padding-bottom: 10px;
-        }}
-        .stats {{ 
+        }
+        .stats { 
             background-color: #f8f9fa; 
             padding: 15px; 
             border-radius: 5px; 
             margin-bottom: 20px; 
             text-align: center;
-        }}
-        .post {{ 
+        }
+        .post { 
             border: 1px solid #dee2e6; 
             border-radius: 8px; 
             margin-bottom: 20px; 
             padding: 20px; 
             background-color: #fff;
-        }}
-        .post-header {{ 
+        }
+        .post-header { 
             display: flex; 
             justify-content: space-between; 
             align-items: center; 
             margin-bottom: 15px; 
             padding-bottom: 10px;
             border-bottom: 1px solid #e9ecef;
-        }}
-        .post-id {{ 
+        }
+        .post-id { 
             font-weight: bold; 
             color: #007bff; 
             font-size: 1.1em;
-        }}
-        .post-link {{ 
+        }
+        .post-link { 
             background-color: #007bff; 
             color: white; 
             padding: 8px 15px; 
             text-decoration: none; 
             border-radius: 5px; 
             font-size: 0.9em;
-        }}
-        .post-link:hover {{ 
+        }
+        .post-link:hover { 
             background-color: #0056b3; 
             text-decoration: none;
             color: white;
-        }}
-        .post-content {{ 
+        }
+        .post-content { 
             margin: 15px 0; 
             padding: 15px; 
             background-color: #f8f9fa; 
             border-left: 4px solid #dc3545; 
             border-radius: 0 5px 5px 0;
-        }}
-        .post-metrics {{ 
+        }
+        .post-metrics { 
             display: grid; 
             grid-template-columns: repeat(auto-fit, minmax(150px, 1fr)); 
             gap: 15px; 
@@ -233,238 +118,153 @@ class ReportGenerator:
             padding: 15px;
             background-color: #f8f9fa;
             border-radius: 5px;
-        }}
-        .metric {{ 
+        }
+        .metric { 
             text-align: center; 
             padding: 10px;
             background-color: white;
             border-radius: 5px;
-        }}
-        .metric-value {{ 
+        }
+        .metric-value { 
             font-size: 1.4em; 
             font-weight: bold; 
             color: #dc3545; 
-        }}
-        .metric-label {{ 
+        }
+        .metric-label { 
             color: #6c757d; 
             font-size: 0.9em; 
             margin-top: 5px;
-        }}
-        .timestamp {{ 
+        }
+        .timestamp { 
             text-align: center; 
             color: #6c757d; 
             margin-top: 30px; 
             padding-top: 20px;
             border-top: 1px solid #e9ecef;
-        }}
-            </style>
-        </head>
-        <body>
-            <div class="container">
-        <h1>🔥 Топ {len(negative_posts)} негативных постов</h1>
-        
-        <div class="stats">
-            <h3>📊 Статистика отчета</h3>
-            <p>Всего негативных постов найдено: <strong>{len(negative_posts)}</strong></p>
-            <p>Отчет создан: <strong>{datetime.now().strftime('%Y-%m-%d в %H:%M:%S')}</strong></p>
-        </div>
-"""
-        
-        if not negative_posts:
-            html += """
+        }
+            """
+
+_SINGLE_REPORT_EMPTY = """
         <div style="text-align: center; color: #6c757d; padding: 40px;">
             <h3>🎉 Отличные новости!</h3>
             <p>Негативных постов не найдено. Все посты имеют нейтральное или позитивное настроение.</p>
         </div>
             """
-        else:
-            for i, post in enumerate(negative_posts, 1):
-                # Format date
-                formatted_date = post['date']
-                
-                # Generate Telegram link
-                post_link = f"https://t.me/{channel_username}/{post['id']}"
-                
-                # Clean and truncate long text
-                text_preview = clean_text_preview(post['text'], 500)
-                
-                html += f"""
-        <div class="post">
-            <div class="post-header">
-                <div class="post-id">#{i} | Post ID: {post['id']} | 📅 {formatted_date}</div>
-                <a href="{post_link}" target="_blank" class="post-link">🔗 Открыть в Telegram</a>
-            </div>
-            
-            <div class="post-content">
-                <p>{text_preview}</p>
-            </div>
-            
-            <div class="post-metrics">
-                <div class="metric">
-                    <div class="metric-value">{post['negative_score']:.3f}</div>
-                    <div class="metric-label">Негативная оценка</div>
-                </div>
-                <div class="metric">
-                    <div class="metric-value">{post['total_comments']}</div>
-                    <div class="metric-label">Всего комментариев</div>
-                </div>
-                <div class="metric">
-                    <div class="metric-value">{post['negative_comments']}</div>
-                    <div class="metric-label">Негативных комментариев</div>
-                </div>
-                <div class="metric">
-                    <div class="metric-value">{post['negative_comment_percentage']:.1f}%</div>
-                    <div class="metric-label">% негативных комментариев</div>
-                </div>
-                <div class="metric">
-                    <div class="metric-value">{post['views']}</div>
-                    <div class="metric-label">👀 Просмотры</div>
-                </div>
-                <div class="metric">
-                    <div class="metric-value">{post['forwards']}</div>
-                    <div class="metric-label">↗️ Пересылки</div>
-                </div>
-            </div>
-        </div>
-                """
-        
-        html += f"""
-                <div class="timestamp">
-            Отчет создан системой анализа настроений Telegram новостей<br>
-            {datetime.now().strftime('%Y-%m-%d в %H:%M:%S')}
-                </div>
-            </div>
-        </body>
-        </html>
-        """
-        
-        return html
-    
-    def _create_multichannel_html_report(self, channels_data: Dict, total_messages: int, total_negative: int) -> str:
-        """Создаем HTML шаблон для отчета о негативных постах, сгруппированных по каналам, соответствующий стилю Telegram"""
-        
-        negative_percentage = round((total_negative / total_messages * 100) if total_messages > 0 else 0, 1)
-        
-        html = f"""<!DOCTYPE html>
-<html lang="ru">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>📊 Данные анализа</title>
-    <style>
-        body {{ 
+
+_MULTICHANNEL_REPORT_CSS = """
+        body { 
             font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, Helvetica, Arial, sans-serif;
             margin: 0; 
             padding: 20px; 
             background-color: #1c1c1e;
             color: #ffffff;
             line-height: 1.4;
-        }}
-        .container {{ 
+        }
+        .container { 
             max-width: 800px; 
             margin: 0 auto; 
             background-color: #2c2c2e;
             border-radius: 12px; 
             overflow: hidden;
             box-shadow: 0 4px 16px rgba(0,0,0,0.3);
-        }}
-        .header {{ 
+        }
+        .header { 
             background-color: #0a84ff;
             color: white; 
             padding: 20px; 
             text-align: center;
-        }}
-        .header h1 {{ 
+        }
+        .header h1 { 
             margin: 0; 
             font-size: 1.5em; 
             font-weight: 600;
-        }}
-        .metadata {{ 
+        }
+        .metadata { 
             padding: 20px;
             background-color: #3a3a3c;
             border-bottom: 1px solid #48484a;
-        }}
-        .metadata h2 {{
+        }
+        .metadata h2 {
             margin: 0 0 15px 0;
             font-size: 1.2em;
             font-weight: 600;
-        }}
-        .metadata-item {{
+        }
+        .metadata-item {
             margin: 8px 0;
             font-size: 0.95em;
             display: flex;
             align-items: center;
-        }}
-        .metadata-item::before {{
+        }
+        .metadata-item::before {
             content: "•";
             color: #0a84ff;
             margin-right: 8px;
             font-weight: bold;
-        }}
-        .channel-section {{
+        }
+        .channel-section {
             border-bottom: 1px solid #48484a;
-        }}
-        .channel-header {{
+        }
+        .channel-header {
             background-color: #3a3a3c;
             padding: 15px 20px;
             font-weight: 600;
             font-size: 1.1em;
             border-bottom: 1px solid #48484a;
-        }}
-        .channel-title {{
+        }
+        .channel-title {
             color: #0a84ff;
-        }}
-        .posts-header {{
+        }
+        .posts-header {
             background-color: #2c2c2e;
             padding: 15px 20px;
             font-weight: 600;
             color: #ffffff;
             border-bottom: 1px solid #48484a;
-        }}
-        .post {{
+        }
+        .post {
             padding: 20px;
             border-bottom: 1px solid #48484a;
             background-color: #2c2c2e;
-        }}
-        .post:last-child {{
+        }
+        .post:last-child {
             border-bottom: none;
-        }}
-        .post-header {{
+        }
+        .post-header {
             margin-bottom: 12px;
-        }}
-        .post-id {{
+        }
+        .post-id {
             font-weight: 600;
             font-size: 1.1em;
             color: #ffffff;
             margin-bottom: 8px;
-        }}
-        .post-date {{
+        }
+        .post-date {
             color: #98989a;
             font-size: 0.9em;
             margin-bottom: 8px;
-        }}
-        .post-metrics {{
+        }
+        .post-metrics {
             display: flex;
             flex-wrap: wrap;
             gap: 12px;
             margin: 12px 0;
             font-size: 0.9em;
-        }}
-        .metric {{
+        }
+        .metric {
             color: #98989a;
-        }}
-        .metric.score {{
+        }
+        .metric.score {
             color: #ff453a;
             font-weight: 600;
-        }}
-        .post-content {{
+        }
+        .post-content {
             background-color: #3a3a3c;
             padding: 15px;
             border-radius: 8px;
             margin: 12px 0;
             border-left: 3px solid #0a84ff;
-        }}
-        .post-link {{
+        }
+        .post-link {
             display: inline-block;
             background-color: #0a84ff;
             color: white;
@@ -474,25 +274,357 @@ class ReportGenerator:
             font-size: 0.9em;
             margin-top: 12px;
             transition: background-color 0.2s;
-        }}
-        .post-link:hover {{
+        }
+        .post-link:hover {
             background-color: #0056b3;
             color: white;
             text-decoration: none;
-        }}
-        .timestamp {{
+        }
+        .timestamp {
             text-align: center;
             padding: 20px;
             color: #98989a;
             font-size: 0.85em;
             background-color: #1c1c1e;
-        }}
-        .no-posts {{
+        }
+        .no-posts {
             padding: 40px 20px;
             text-align: center;
             color: #98989a;
-        }}
-    </style>
+        }
+    """
+
+_MULTICHANNEL_REPORT_EMPTY = """
+        <div class="no-posts">
+            <h3>🎉 Отличные новости!</h3>
+            <p>Негативных постов не найдено. Все посты имеют нейтральное или позитивное настроение.</p>
+        </div>
+            """
+
+
+@dataclass(slots=True)
+class PostRecord:
+    """Негативный пост в отчете (orjson сериализует dataclass напрямую)"""
+    id: int
+    date: str
+    text: str
+    negative_score: float
+    total_comments: int
+    negative_comments: int
+    negative_comment_percentage: float
+    views: int
+    forwards: int
+    replies: int
+    channel: str = ''
+    channel_title: str = ''
+
+
+def _write_json(path: str, data: Dict) -> None:
+    """Записать данные отчета в JSON файл"""
+    with open(path, 'wb') as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
+
+
+def _write_html(path: str, chunks: Iterable[str]) -> None:
+    """Записать HTML отчет в файл по частям"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.writelines(chunks)
+
+
+class ReportGenerator:
+    # Шаблоны карточки поста разбираются один раз при определении класса
+    _SINGLE_POST_TEMPLATE = """
+        <div class="post">
+            <div class="post-header">
+                <div class="post-id">#{i} | Post ID: {post.id} | 📅 {formatted_date}</div>
+                <a href="{post_link}" target="_blank" class="post-link">🔗 Открыть в Telegram</a>
+            </div>
+            
+            <div class="post-content">
+                <p>{text_preview}</p>
+            </div>
+            
+            <div class="post-metrics">
+                <div class="metric">
+                    <div class="metric-value">{post.negative_score:.3f}</div>
+                    <div class="metric-label">Негативная оценка</div>
+                </div>
+                <div class="metric">
+                    <div class="metric-value">{post.total_comments}</div>
+                    <div class="metric-label">Всего комментариев</div>
+                </div>
+                <div class="metric">
+                    <div class="metric-value">{post.negative_comments}</div>
+                    <div class="metric-label">Негативных комментариев</div>
+                </div>
+                <div class="metric">
+                    <div class="metric-value">{post.negative_comment_percentage:.1f}%</div>
+                    <div class="metric-label">% негативных комментариев</div>
+                </div>
+                <div class="metric">
+                    <div class="metric-value">{post.views}</div>
+                    <div class="metric-label">👀 Просмотры</div>
+                </div>
+                <div class="metric">
+                    <div class="metric-value">{post.forwards}</div>
+                    <div class="metric-label">↗️ Пересылки</div>
+                </div>
+            </div>
+        </div>
+                """
+    
+    _MULTICHANNEL_POST_TEMPLATE = """
+            <div class="post">
+                <div class="post-header">
+                    <div class="post-id">{i}. Пост ID {post.id}</div>
+                    <div class="post-date">🗓 {formatted_date}</div>
+                    <div class="post-metrics">
+                        <span class="metric score">📊 Оценка: {post.negative_score:.3f}</span>
+                        <span class="metric">💬 Комментарии: {post.negative_comments}/{post.total_comments} ({comment_percentage} нег.)</span>
+                        <span class="metric">👀 Просмотры: {post.views} | ↗️ Перепосты: {post.forwards}</span>
+                    </div>
+                </div>
+                <div class="post-content">
+                    📄 {text_preview}
+                </div>
+                <a href="{post_link}" target="_blank" class="post-link">🔗 Открыть в Telegram</a>
+            </div>
+"""
+    
+    def __init__(self, output_dir: str = None):
+        self.output_dir = output_dir or Config.OUTPUT_DIR
+        # Директории, уже созданные этим генератором
+        self._made_dirs = set()
+        self._ensure_dir(self.output_dir)
+    
+    def _ensure_dir(self, path: str) -> None:
+        """Создать директорию, если этот генератор еще не создавал ее"""
+        if path not in self._made_dirs:
+            os.makedirs(path, exist_ok=True)
+            self._made_dirs.add(path)
+    
+    def generate_multichannel_negative_posts_report(self, messages: List[Dict], max_posts: int = 100, output_dir: str = None) -> Dict:
+        """
+        Генерация отчета для негативных постов, сгруппированных по каналам.
+        
+        Args:
+            messages: Список аназированных сообщений с данными о настроении (включая информацию о канале)
+            max_posts: Максимальное количество постов на канал
+            output_dir: Пользовательская директория вывода (опционально)
+            
+        Returns:
+            Словарь с путями к сгенерированным файлам и статистикой по каналам
+        """
+        logger.info("Generating report for negative posts, grouped by channels. Maximum number of posts per channel: %s", max_posts)
+        
+        # Время отчета берем один раз, чтобы JSON, HTML и имя директории совпадали
+        now = datetime.now()
+        
+        channels_data = {}
+        total_messages = 0
+        total_negative = 0
+        
+        for msg in messages:
+            mg = msg.get
+            channel = mg('channel', '@unknown')
+            
+            # Название канала берем из первого сообщения канала и дальше не перечитываем
+            channel_info = channels_data.get(channel)
+            if channel_info is None:
+                channel_info = channels_data[channel] = {
+                    'channel_title': mg('channel_title', channel),
+                    'total_count': 0,
+                    'negative_posts': []
+                }
+            
+            # Сами сообщения не храним: для статистики достаточно счетчика
+            channel_info['total_count'] += 1
+            total_messages += 1
+            
+            if mg('is_negative', False):
+                total_negative += 1
+                
+                # Форматируем сообщение для отчета
+                comments = mg('comments') or ()
+                total_comments = len(comments)
+                # У проанализированных комментариев флаг is_negative всегда bool, суммируем его напрямую
+                negative_comments = sum(map(_get_is_negative, comments))
+                negative_comment_percentage = (negative_comments / total_comments * 100) if total_comments > 0 else 0
+                
+                post_date = mg('date')
+                if hasattr(post_date, 'strftime'):
+                    formatted_date = post_date.strftime('%Y-%m-%d %H:%M:%S')
+                else:
+                    formatted_date = str(post_date)
+                
+                negative_score = round((mg('sentiment') or _EMPTY).get('negative', 0), 4)
+                
+                post_data = PostRecord(
+                    id=mg('id'),
+                    date=formatted_date,
+                    text=mg('text', ''),
+                    negative_score=negative_score,
+                    total_comments=total_comments,
+                    negative_comments=negative_comments,
+                    negative_comment_percentage=round(negative_comment_percentage, 2),
+                    views=mg('views', 0),
+                    forwards=mg('forwards', 0),
+                    replies=mg('replies', 0),
+                    channel=channel,
+                    channel_title=channel_info['channel_title']
+                )
+                
+                # Храним только топ max_posts постов канала в min-куче по оценке.
+                # При равной оценке вытесняется более поздний пост, как при стабильной сортировке.
+                heap = channel_info['negative_posts']
+                entry = (negative_score, -total_negative, post_data)
+                if len(heap) < max_posts:
+                    heapq.heappush(heap, entry)
+                elif max_posts > 0 and entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+        
+        # Разворачиваем кучи в списки постов, отсортированные по убыванию оценки
+        # (без негативных постов все кучи пусты, и обходить их незачем)
+        if total_negative:
+            for channel_info in channels_data.values():
+                channel_info['negative_posts'] = [post for _, _, post in sorted(channel_info['negative_posts'], reverse=True)]
+        
+        if output_dir is None:
+            report_timestamp = now.strftime("%Y%m%d_%H%M%S")
+            output_dir = os.path.join(self.output_dir, f"multichannel_negative_posts_{report_timestamp}")
+        
+        self._ensure_dir(output_dir)
+        
+        # Генерируем JSON отчет с многоканальной структурой
+        json_data = {
+            'metadata': {
+                'timestamp': now.isoformat(),
+                'generated_at': now.strftime('%Y-%m-%d %H:%M:%S'),
+                'total_channels': len(channels_data),
+                'total_messages': total_messages,
+                'total_negative': total_negative,
+                'negative_percentage': round((total_negative / total_messages * 100) if total_messages > 0 else 0, 1)
+            },
+            'channels': {}
+        }
+        
+        # Добавляем данные канала в JSON
+        for channel, channel_info in channels_data.items():
+            negative_count = len(channel_info['negative_posts'])
+            total_count = channel_info['total_count']
+            json_data['channels'][channel] = {
+                'channel_title': channel_info['channel_title'],
+                'total_messages': total_count,
+                'negative_posts_count': negative_count,
+                'negative_percentage': round((negative_count / total_count * 100) if total_count > 0 else 0, 1),
+                'negative_posts': channel_info['negative_posts']
+            }
+        
+        json_path = os.path.join(output_dir, "multichannel_negative_posts.json")
+        html_path = os.path.join(output_dir, "multichannel_negative_posts.html")
+        
+        html_chunks = self._iter_multichannel_html_report(channels_data, total_messages, total_negative, now)
+        
+        if total_negative:
+            # JSON и HTML независимы, поэтому пишем их параллельно
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                json_future = executor.submit(_write_json, json_path, json_data)
+                html_future = executor.submit(_write_html, html_path, html_chunks)
+                json_future.result()
+                html_future.result()
+        else:
+            # Пустой отчет занимает пару килобайт, пул потоков для него не нужен
+            _write_json(json_path, json_data)
+            _write_html(html_path, html_chunks)
+        
+        result = {
+            'output_dir': output_dir,
+            'html_path': html_path,
+            'posts_count': total_negative,
+            'json_path': json_path,
+            'channels_data': channels_data,
+            'total_messages': total_messages,
+            'total_negative': total_negative,
+        }
+        return result
+        
+    def _create_html_report(self, negative_posts: List[PostRecord], now: datetime = None) -> str:
+        """Создаем простой HTML шаблон для отчета о негативных постах"""
+        
+        generated_at = (now or datetime.now()).strftime('%Y-%m-%d в %H:%M:%S')
+        
+        # Получаем имя канала из конфига для генерации ссылки
+        channel_username = ""
+        base_url = f"https://t.me/{channel_username}/"
+        
+        parts = [f"""<!DOCTYPE html>
+        <html lang="ru">
+        <head>
+            <meta charset="UTF-8">
+            <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>Топ {len(negative_posts)} негативных постов</title>
+            <style>{_SINGLE_REPORT_CSS}</style>
+        </head>
+        <body>
+            <div class="container">
+        <h1>🔥 Топ {len(negative_posts)} негативных постов</h1>
+        
+        <div class="stats">
+            <h3>📊 Статистика отчета</h3>
+            <p>Всего негативных постов найдено: <strong>{len(negative_posts)}</strong></p>
+            <p>Отчет создан: <strong>{generated_at}</strong></p>
+        </div>
+"""]
+        
+        if not negative_posts:
+            parts.append(_SINGLE_REPORT_EMPTY)
+        else:
+            for i, post in enumerate(negative_posts, 1):
+                # Format date
+                formatted_date = post.date
+                
+                # Generate Telegram link
+                post_link = base_url + str(post.id)
+                
+                # Clean and truncate long text
+                text_preview = clean_text_preview(post.text, 500)
+                
+                parts.append(self._SINGLE_POST_TEMPLATE.format(
+                    i=i, post=post, formatted_date=formatted_date,
+                    post_link=post_link, text_preview=text_preview
+                ))
+        
+        parts.append(f"""
+                <div class="timestamp">
+            Отчет создан системой анализа настроений Telegram новостей<br>
+            {generated_at}
+                </div>
+            </div>
+        </body>
+        </html>
+        """)
+        
+        # Склеиваем фрагменты один раз вместо многократной конкатенации строк
+        return ''.join(parts)
+    
+    def _iter_multichannel_html_report(self, channels_data: Dict, total_messages: int, total_negative: int, now: datetime = None) -> Iterator[str]:
+        """
+        Создаем HTML отчет о негативных постах, сгруппированных по каналам, в стиле Telegram.
+        
+        Отчет отдается по частям, чтобы его можно было писать в файл потоком,
+        не собирая всю страницу в одну строку в памяти.
+        """
+        
+        generated_at = (now or datetime.now()).strftime('%Y-%m-%d в %H:%M:%S')
+        negative_percentage = round((total_negative / total_messages * 100) if total_messages > 0 else 0, 1)
+        
+        yield f"""<!DOCTYPE html>
+<html lang="ru">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>📊 Данные анализа</title>
+    <style>{_MULTICHANNEL_REPORT_CSS}</style>
 </head>
 <body>
     <div class="container">
@@ -508,12 +640,7 @@ class ReportGenerator:
 """
         
         if not channels_data or total_negative == 0:
-            html += """
-        <div class="no-posts">
-            <h3>🎉 Отличные новости!</h3>
-            <p>Негативных постов не найдено. Все посты имеют нейтральное или позитивное настроение.</p>
-        </div>
-            """
+            yield _MULTICHANNEL_REPORT_EMPTY
         else:
             # Группируем по каналам
             for channel, channel_info in channels_data.items():
@@ -522,7 +649,7 @@ class ReportGenerator:
                     
                 channel_title = channel_info.get('channel_title', channel)
                 
-                html += f"""
+                yield f"""
         <div class="channel-section">
             <div class="channel-header">
                 <span class="channel-title">Канал: {channel_title}</span>
@@ -532,51 +659,39 @@ class ReportGenerator:
             </div>
 """
                 
+                # Базовая ссылка на канал считается один раз, а не для каждого поста
+                channel_username = channel.lstrip('@')
+                base_url = f"https://t.me/{channel_username}/"
+                
                 # Добавляем посты для этого канала
                 for i, post in enumerate(channel_info['negative_posts'], 1):
                     # Форматируем дату
-                    formatted_date = post['date']
+                    formatted_date = post.date
                     
                     # Generate Telegram link
-                    channel_username = channel.replace('@', '') if channel.startswith('@') else channel
-                    post_link = f"https://t.me/{channel_username}/{post['id']}"
+                    post_link = base_url + str(post.id)
                     
                     # Очищаем и обрезаем длинный текст для предварительного просмотра
-                    text_preview = clean_text_preview(post['text'], 200)
+                    text_preview = clean_text_preview(post.text, 200)
                     
                     # Рассчитываем процент отображения
-                    comment_percentage = f"{post['negative_comment_percentage']:.1f}%" if post['total_comments'] > 0 else "0.0%"
+                    comment_percentage = f"{post.negative_comment_percentage:.1f}%" if post.total_comments > 0 else "0.0%"
                     
-                    html += f"""
-            <div class="post">
-                <div class="post-header">
-                    <div class="post-id">{i}. Пост ID {post['id']}</div>
-                    <div class="post-date">🗓 {formatted_date}</div>
-                    <div class="post-metrics">
-                        <span class="metric score">📊 Оценка: {post['negative_score']:.3f}</span>
-                        <span class="metric">💬 Комментарии: {post['negative_comments']}/{post['total_comments']} ({comment_percentage} нег.)</span>
-                        <span class="metric">👀 Просмотры: {post['views']} | ↗️ Перепосты: {post['forwards']}</span>
-                    </div>
-                </div>
-                <div class="post-content">
-                    📄 {text_preview}
-                </div>
-                <a href="{post_link}" target="_blank" class="post-link">🔗 Открыть в Telegram</a>
-            </div>
-"""
+                    yield self._MULTICHANNEL_POST_TEMPLATE.format(
+                        i=i, post=post, formatted_date=formatted_date, post_link=post_link,
+                        text_preview=text_preview, comment_percentage=comment_percentage
+                    )
                 
-                html += """
+                yield """
         </div>
 """
         
-        html += f"""
+        yield f"""
         <div class="timestamp">
             Отчет создан системой анализа настроений Telegram новостей<br>
-            {datetime.now().strftime('%Y-%m-%d в %H:%M:%S')}
+            {generated_at}
         </div>
     </div>
 </body>
 </html>
         """
-        
-        return html 
\ No newline at end of file
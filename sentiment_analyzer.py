@@ -1,40 +1,227 @@
+import hashlib
+import os
 import re
-from typing import List, Dict, Tuple
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
+import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterable, Iterator, Tuple
+import numpy as np
+from transformers import AutoTokenizer, AutoModelForSequenceClassification
 import torch
 from config import Config
 from logging_config import setup_logger
 
 logger = setup_logger(__name__)
 
+# Регулярные выражения очистки текста компилируются один раз при загрузке модуля
+_URL_RE = re.compile(r'https?://\S+')
+_MENTION_RE = re.compile(r'@\w+')
+_HASHTAG_RE = re.compile(r'#\w+')
+_WS_RE = re.compile(r'\s+')
+
+# Порядок меток в массивах оценок
+_SENTIMENT_LABELS = ('positive', 'negative', 'neutral')
+_NEUTRAL_SCORES = (0.0, 0.0, 1.0)
+
+
+def _negative_mask(scores: np.ndarray) -> np.ndarray:
+    """Для каждой строки оценок: негативная оценка больше позитивной и нейтральной"""
+    return scores[:, 1] > np.maximum(scores[:, 0], scores[:, 2])
+
+
+class SentimentDiskCache:
+    """
+    Постоянный кеш оценок настроений в SQLite.
+    Ключ - хеш имени модели и очищенного текста, значение - (positive, negative, neutral).
+    """
+    # Ограничение SQLite на число параметров в одном запросе
+    QUERY_CHUNK = 500
+    
+    def __init__(self, path: str, model_name: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._prefix = model_name.encode('utf-8') + b'\0'
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS sentiment '
+            '(key BLOB PRIMARY KEY, positive REAL, negative REAL, neutral REAL)'
+        )
+        self._conn.commit()
+    
+    def _key(self, text: str) -> bytes:
+        return hashlib.blake2b(self._prefix + text.encode('utf-8'), digest_size=16).digest()
+    
+    def get_many(self, texts: List[str]) -> Dict[str, Tuple[float, float, float]]:
+        """Найти сохраненные оценки для текстов; возвращает только найденные"""
+        keys = {self._key(text): text for text in texts}
+        key_list = list(keys)
+        found = {}
+        
+        for start in range(0, len(key_list), self.QUERY_CHUNK):
+            chunk = key_list[start:start + self.QUERY_CHUNK]
+            placeholders = ','.join('?' * len(chunk))
+            rows = self._conn.execute(
+                f'SELECT key, positive, negative, neutral FROM sentiment WHERE key IN ({placeholders})',
+                chunk
+            )
+            for key, positive, negative, neutral in rows:
+                found[keys[key]] = (positive, negative, neutral)
+        
+        return found
+    
+    def put_many(self, items: Dict[str, Tuple[float, float, float]]):
+        """Сохранить оценки текстов одной транзакцией"""
+        with self._conn:
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO sentiment VALUES (?, ?, ?, ?)',
+                [(self._key(text), *scores) for text, scores in items.items()]
+            )
+
+
 class SentimentAnalyzer:
+    MODEL_NAME = "cardiffnlp/twitter-xlm-roberta-base-sentiment"
+    
+    # Сколько пакетов модели набирать в одну группу при потоковом анализе
+    STREAM_BATCHES_PER_CHUNK = 4
+    
+    # Размер пакета по умолчанию (если SENTIMENT_BATCH_SIZE = 0)
+    CPU_BATCH_SIZE = 64
+    GPU_BATCH_SIZE = 128
+    
     def __init__(self):
         self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.sentiment_pipeline = None
+        if self.device == "cpu":
+            self._configure_cpu_threads()
+        self.batch_size = Config.SENTIMENT_BATCH_SIZE or (
+            self.GPU_BATCH_SIZE if self.device == "cuda" else self.CPU_BATCH_SIZE
+        )
+        self.tokenizer = None
+        self.model = None
+        # Модель без компиляции, на нее откатываемся, если скомпилированная упала
+        self._eager_model = None
+        # Точность весов модели: fp32, fp16 (GPU) или int8 (квантованная на CPU)
+        self._precision = "fp32"
+        # Индексы выходов модели в порядке [positive, negative, neutral]
+        self._label_order = None
+        # LRU-кеш оценок: очищенный текст -> (positive, negative, neutral),
+        # недавно использованные тексты в конце
+        self._cache = OrderedDict()
+        self._disk_cache = None
         self.initialize_models()
     
+    def _configure_cpu_threads(self):
+        """
+        Ограничение числа потоков torch на CPU.
+        Для коротких комментариев многопоточность внутри одной операции больше
+        тратит на синхронизацию, чем ускоряет; выигрыш дает пакетная обработка текстов.
+        """
+        num_threads = Config.TORCH_NUM_THREADS
+        if num_threads <= 0:
+            return
+        
+        torch.set_num_threads(num_threads)
+        try:
+            torch.set_num_interop_threads(num_threads)
+        except RuntimeError as e:
+            # Число inter-op потоков нельзя менять после начала параллельной работы torch
+            logger.debug(f"Could not set torch inter-op threads: {e}")
+    
     def initialize_models(self):
         """Инициализация моделей анализа настроений"""
         try:
             # Использование многоязычной модели настроений для лучших результатов
-            model_name = "cardiffnlp/twitter-xlm-roberta-base-sentiment"
+            model_name = self.MODEL_NAME
             
-            # Принудительно используем slow tokenizer для избежания ошибок конвертации
-            tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=False)
+            # Быстрый (Rust) токенизатор; если конвертация из sentencepiece не удалась, берем медленный
+            try:
+                tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=True)
+            except (ValueError, ImportError) as e:
+                logger.warning(f"Fast tokenizer is unavailable, falling back to slow one: {e}")
+                tokenizer = AutoTokenizer.from_pretrained(model_name, use_fast=False)
             model = AutoModelForSequenceClassification.from_pretrained(model_name)
+            model.eval()
             
-            self.sentiment_pipeline = pipeline(
-                "sentiment-analysis",
-                model=model,
-                tokenizer=tokenizer,
-                device=0 if self.device == "cuda" else -1,
-                return_all_scores=True
-            )
+            # На GPU веса в fp16: вдвое меньше памяти и пропускной способности, работают TensorCores
+            if self.device == "cuda":
+                model = model.half()
+                self._precision = "fp16"
+            elif Config.TORCH_QUANTIZE:
+                model = self._quantize_model(model)
+            model.to(self.device)
+            
+            self._label_order = self._get_label_order(model.config.id2label)
+            self.tokenizer = tokenizer
+            self._eager_model = model
+            self.model = self._compile_model(model) if Config.TORCH_COMPILE else model
             logger.info(f"Initialized sentiment model on {self.device}")
         except Exception as e:
             logger.warning(f"Failed to load transformer model: {e}")
             logger.info("Falling back to TextBlob for sentiment analysis")
-            self.sentiment_pipeline = None
+            self.tokenizer = None
+            self.model = None
+            return
+        
+        if Config.SENTIMENT_CACHE_PATH:
+            try:
+                # Оценки зависят от модели, точности весов и длины обрезки текста
+                self._disk_cache = SentimentDiskCache(
+                    Config.SENTIMENT_CACHE_PATH, f"{self.MODEL_NAME}:{self._precision}:{Config.MAX_SEQ_LEN}"
+                )
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"Sentiment disk cache is disabled: {e}")
+                self._disk_cache = None
+    
+    def _quantize_model(self, model):
+        """Динамическое int8-квантование Linear-слоев для CPU; при ошибке остается fp32"""
+        try:
+            quantized = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            self._precision = "int8"
+            return quantized
+        except Exception as e:
+            logger.warning(f"Failed to quantize sentiment model, using fp32: {e}")
+            return model
+    
+    def _compile_model(self, model):
+        """Компиляция модели через torch.compile; при ошибке остается обычная модель"""
+        try:
+            mode = "reduce-overhead" if self.device == "cuda" else "default"
+            compiled = torch.compile(model, mode=mode, dynamic=True)
+            logger.info(f"Sentiment model compiled with torch.compile (mode={mode})")
+            return compiled
+        except Exception as e:
+            logger.warning(f"torch.compile is unavailable, using eager model: {e}")
+            return model
+    
+    def _run_model(self, encoded):
+        """Логиты модели для пакета; компиляция происходит при первом вызове, поэтому ошибки ловим здесь"""
+        try:
+            return self.model(**encoded).logits
+        except Exception as e:
+            if self.model is self._eager_model:
+                raise
+            logger.warning(f"Compiled sentiment model failed, switching to eager mode: {e}")
+            self.model = self._eager_model
+            return self.model(**encoded).logits
+    
+    @staticmethod
+    def _get_label_order(id2label: Dict[int, str]) -> List[int]:
+        """Индексы выходов модели для меток positive, negative и neutral (в этом порядке)"""
+        label_order = [None, None, None]
+        
+        for idx, label in id2label.items():
+            label = label.lower()
+            if 'positive' in label or label == 'pos':
+                label_order[0] = int(idx)
+            elif 'negative' in label or label == 'neg':
+                label_order[1] = int(idx)
+            else:
+                label_order[2] = int(idx)
+        
+        if None in label_order:
+            raise ValueError(f"Unexpected sentiment labels: {id2label}")
+        return label_order
     
     def clean_text(self, text: str) -> str:
         """Очистка текста для анализа"""
@@ -42,96 +229,243 @@ class SentimentAnalyzer:
             return ""
         
         # Удаление URL, упоминаний, хештегов
-        text = re.sub(r'http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', '', text)
-        text = re.sub(r'@\w+', '', text)
-        text = re.sub(r'#\w+', '', text)
+        text = _URL_RE.sub('', text)
+        text = _MENTION_RE.sub('', text)
+        text = _HASHTAG_RE.sub('', text)
         
         # Удаление лишних пробелов
-        text = re.sub(r'\s+', ' ', text).strip()
+        text = _WS_RE.sub(' ', text).strip()
         
         return text
     
+    def _encode(self, texts: List[str]):
+        """Токенизация одного пакета; на GPU тензоры сразу отправляются на устройство"""
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=Config.MAX_SEQ_LEN,
+            return_tensors="pt"
+        )
+        if self.device == "cuda":
+            # Из закрепленной памяти копирование на GPU идет асинхронно с вычислениями
+            encoded = {
+                name: tensor.pin_memory().to(self.device, non_blocking=True)
+                for name, tensor in encoded.items()
+            }
+        return encoded
+    
+    def _forward(self, texts: List[str]) -> np.ndarray:
+        """
+        Прямой прогон модели пакетами по self.batch_size
+        без учета градиентов (autograd не нужен для инференса).
+        
+        Пока модель считает текущий пакет, следующий токенизируется в фоновом
+        потоке: быстрый токенизатор и операции torch отпускают GIL.
+        
+        Returns:
+            Массив (len(texts), 3) вероятностей в порядке [positive, negative, neutral]
+        """
+        if not texts:
+            return np.empty((0, 3))
+        
+        batch_size = self.batch_size
+        
+        # Тексты близкой длины попадают в один пакет, поэтому паддинга почти нет
+        order = np.argsort([len(text) for text in texts], kind='stable')
+        sorted_texts = [texts[i] for i in order]
+        text_batches = [sorted_texts[start:start + batch_size] for start in range(0, len(sorted_texts), batch_size)]
+        batches = []
+        
+        with ThreadPoolExecutor(max_workers=1) as executor, torch.inference_mode():
+            next_encoded = executor.submit(self._encode, text_batches[0])
+            for k in range(len(text_batches)):
+                encoded = next_encoded.result()
+                if k + 1 < len(text_batches):
+                    next_encoded = executor.submit(self._encode, text_batches[k + 1])
+                logits = self._run_model(encoded)
+                batches.append(logits.float().softmax(-1)[:, self._label_order].cpu().numpy())
+        
+        # Возвращаем строки в исходный порядок текстов
+        sorted_probs = np.concatenate(batches)
+        probs = np.empty_like(sorted_probs)
+        probs[order] = sorted_probs
+        return probs
+    
+    def _remember(self, text: str, scores: Tuple[float, float, float]):
+        """Сохранить оценки текста в кеш, вытесняя давно не использованную запись при переполнении"""
+        if Config.SENTIMENT_CACHE_SIZE <= 0:
+            return
+        if len(self._cache) >= Config.SENTIMENT_CACHE_SIZE:
+            self._cache.popitem(last=False)
+        self._cache[text] = scores
+    
+    @staticmethod
+    def _is_trivial(cleaned_text: str) -> bool:
+        """
+        Текст без сигнала для модели: пустой, короче Config.MIN_SENTIMENT_LEN
+        или без единой буквы (реакции вида "+", "!!", "100").
+        Такие тексты сразу считаются нейтральными, без прогона модели.
+        """
+        if not cleaned_text:
+            return True
+        if Config.MIN_SENTIMENT_LEN <= 0:
+            return False
+        return len(cleaned_text) < Config.MIN_SENTIMENT_LEN or not any(c.isalpha() for c in cleaned_text)
+    
     def analyze_sentiment_transformer(self, text: str) -> Dict[str, float]:
         """Анализ настроений с использованием трансформер модели"""
         try:
-            results = self.sentiment_pipeline(text)[0]
-
-            # Преобразование в стандартизованный формат
-            sentiment_scores = {'positive': 0.0, 'negative': 0.0, 'neutral': 0.0}
-            
-            for result in results:
-                label = result['label'].lower()
-                score = result['score']
-                
-                if 'positive' in label or label == 'pos':
-                    sentiment_scores['positive'] = score
-                elif 'negative' in label or label == 'neg':
-                    sentiment_scores['negative'] = score
-                else:
-                    sentiment_scores['neutral'] = score
-            
-            return sentiment_scores
-            
+            return dict(zip(_SENTIMENT_LABELS, self._forward([text])[0].tolist()))
         except Exception as e:
             logger.error(f"Ошибка в анализе настроений трансформером: {e}")
             return {}
     
-    def analyze_sentiment(self, text: str) -> Dict[str, float]:
-        """Анализ настроений"""
-        cleaned_text = self.clean_text(text)
-
-        if not cleaned_text:
-            return {'positive': 0.0, 'negative': 0.0, 'neutral': 1.0}
+    def _score_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        Пакетная оценка текстов.
+        Все тексты, которых нет в кешах, проходят через модель одним вызовом
+        пакетами по self.batch_size.
         
-        if self.sentiment_pipeline:
-            return self.analyze_sentiment_transformer(cleaned_text)
-        else:
+        Returns:
+            Массив (len(texts), 3) в порядке [positive, negative, neutral];
+            строки текстов, которые не удалось оценить, заполнены NaN
+        """
+        scores = np.full((len(texts), 3), np.nan)
+        # Очищенный текст -> позиции, где он встречается; повторы идут в модель один раз
+        pending = {}
+        
+        for i, text in enumerate(texts):
+            cleaned_text = self.clean_text(text)
+            if self._is_trivial(cleaned_text):
+                scores[i] = _NEUTRAL_SCORES
+                continue
+            
+            cached = self._cache.get(cleaned_text)
+            if cached is not None:
+                self._cache.move_to_end(cleaned_text)
+                scores[i] = cached
+            else:
+                pending.setdefault(cleaned_text, []).append(i)
+        
+        # Тексты, которых нет в памяти, ищем в постоянном кеше
+        if pending and self._disk_cache is not None:
+            try:
+                stored = self._disk_cache.get_many(list(pending))
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to read sentiment disk cache: {e}")
+                stored = {}
+            for cleaned_text, row in stored.items():
+                self._remember(cleaned_text, row)
+                scores[pending.pop(cleaned_text)] = row
+        
+        if not pending:
+            return scores
+        
+        if self.model is None:
             logger.error("Модель анализа настроений не инициализирована")
-            return {}
+            return scores
+        
+        model_texts = list(pending)
+        try:
+            probs = self._forward(model_texts)
+        except Exception as e:
+            logger.error(f"Ошибка в пакетном анализе настроений трансформером: {e}")
+            return scores
+        
+        rows = [tuple(row) for row in probs.tolist()]
+        for cleaned_text, row in zip(model_texts, rows):
+            self._remember(cleaned_text, row)
+            scores[pending[cleaned_text]] = row
+        
+        if self._disk_cache is not None:
+            try:
+                self._disk_cache.put_many(dict(zip(model_texts, rows)))
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to write sentiment disk cache: {e}")
+        
+        return scores
+    
+    def analyze_sentiment_batch(self, texts: List[str]) -> List[Dict[str, float]]:
+        """
+        Пакетный анализ настроений.
+        
+        Returns:
+            Список оценок в том же порядке, что и texts (пустой словарь, если текст не удалось оценить)
+        """
+        return [
+            dict(zip(_SENTIMENT_LABELS, row)) if row[0] == row[0] else {}
+            for row in self._score_texts(texts).tolist()
+        ]
+    
+    def analyze_sentiment(self, text: str) -> Dict[str, float]:
+        """Анализ настроений (через пакетный путь, чтобы использовались оба кеша)"""
+        return self.analyze_sentiment_batch([text])[0]
     
     def get_dominant_sentiment(self, sentiment_scores: Dict[str, float]) -> str:
         """Получение доминирующего настроения из оценок"""
-        return max(sentiment_scores.items(), key=lambda x: x[1])[0]
+        return max(sentiment_scores, key=sentiment_scores.__getitem__)
     
     def is_negative(self, sentiment_scores: Dict[str, float]) -> bool:
         """Проверка, является ли настроение преимущественно негативным"""
         return sentiment_scores['negative'] > max(sentiment_scores['positive'], sentiment_scores['neutral'])
     
-    def determine_post_sentiment_from_comments(self, comments: List[Dict]) -> Tuple[Dict[str, float], str, bool]:
+    def determine_post_sentiment_from_comments(self, comments: List[Dict],
+                                               comment_sentiments: List[Dict[str, float]] = None) -> Tuple[Dict[str, float], str, bool]:
         """
         Определение настроения поста на основе анализа комментариев.
         Если более NEGATIVE_COMMENT_THRESHOLD% комментариев негативные, пост считается негативным.
         
+        Args:
+            comments: Комментарии поста
+            comment_sentiments: Уже посчитанные оценки комментариев (если None, считаются здесь)
+        
         Returns:
             Tuple[sentiment_scores, dominant_sentiment, is_negative]
         """
         if not comments:
+            return self._aggregate_post_sentiment(np.empty((0, 3)))
+        
+        # Анализируем настроения всех комментариев одним пакетом
+        if comment_sentiments is None:
+            scores = self._score_texts([comment['text'] for comment in comments])
+        else:
+            scores = np.array(
+                [(cs['positive'], cs['negative'], cs['neutral']) for cs in comment_sentiments],
+                dtype=np.float64
+            )
+        
+        return self._aggregate_post_sentiment(scores)
+    
+    def _aggregate_post_sentiment(self, scores: np.ndarray,
+                                  negative_mask: np.ndarray = None) -> Tuple[Dict[str, float], str, bool]:
+        """
+        Настроение поста по матрице оценок его комментариев (N, 3)
+        со столбцами [positive, negative, neutral].
+        
+        Args:
+            scores: Оценки комментариев
+            negative_mask: Уже посчитанные признаки негативности комментариев (если None, считаются здесь)
+        
+        Returns:
+            Tuple[sentiment_scores, dominant_sentiment, is_negative]
+        """
+        total_comments = len(scores)
+        if not total_comments:
             # Если комментариев нет, возвращаем нейтральное настроение
             neutral_sentiment = {'positive': 0.0, 'negative': 0.0, 'neutral': 1.0}
             return neutral_sentiment, 'neutral', False
         
-        # Анализируем настроения всех комментариев
-        comment_sentiments = []
-        negative_count = 0
-        total_comments = len(comments)
+        if np.isnan(scores).any():
+            raise RuntimeError("Не удалось получить оценки настроений для части комментариев")
         
-        # Собираем данные о настроениях комментариев
-        positive_scores = []
-        negative_scores = []
-        neutral_scores = []
+        # Подсчитываем негативные комментарии (то же условие, что в is_negative)
+        if negative_mask is None:
+            negative_mask = _negative_mask(scores)
+        negative_count = int(negative_mask.sum())
         
-        for comment in comments:
-            comment_sentiment = self.analyze_sentiment(comment['text'])
-            comment_sentiments.append(comment_sentiment)
-            
-            # Подсчитываем негативные комментарии
-            if self.is_negative(comment_sentiment):
-                negative_count += 1
-            
-            # Собираем оценки для усреднения
-            positive_scores.append(comment_sentiment['positive'])
-            negative_scores.append(comment_sentiment['negative'])
-            neutral_scores.append(comment_sentiment['neutral'])
+        # Средние оценки комментариев в порядке [positive, negative, neutral]
+        means = scores.mean(axis=0)
         
         # Вычисляем процент негативных комментариев
         negative_percentage = negative_count / total_comments
@@ -140,59 +474,75 @@ class SentimentAnalyzer:
         if negative_percentage >= Config.NEGATIVE_COMMENT_THRESHOLD:
             # Если много негативных комментариев, пост считается негативным
             # Усиливаем негативную оценку пропорционально проценту негативных комментариев
-            post_sentiment = {
-                'positive': sum(positive_scores) / total_comments * (1 - negative_percentage),
-                'negative': sum(negative_scores) / total_comments + negative_percentage * 0.5,
-                'neutral': sum(neutral_scores) / total_comments * (1 - negative_percentage * 0.5)
-            }
+            post_scores = np.array([
+                means[0] * (1 - negative_percentage),
+                means[1] + negative_percentage * 0.5,
+                means[2] * (1 - negative_percentage * 0.5)
+            ])
             
             # Нормализуем оценки, чтобы сумма была 1.0
-            total_score = sum(post_sentiment.values())
+            total_score = post_scores.sum()
             if total_score > 0:
-                post_sentiment = {k: v / total_score for k, v in post_sentiment.items()}
+                post_scores /= total_score
             
             dominant_sentiment = 'negative'
             is_negative = True
         else:
             # Иначе используем усредненные оценки комментариев
-            post_sentiment = {
-                'positive': sum(positive_scores) / total_comments,
-                'negative': sum(negative_scores) / total_comments,
-                'neutral': sum(neutral_scores) / total_comments
-            }
+            post_scores = means
             
-            dominant_sentiment = self.get_dominant_sentiment(post_sentiment)
-            is_negative = self.is_negative(post_sentiment)
+            # argmax при равенстве берет первую метку, как и max по словарю в get_dominant_sentiment
+            dominant_sentiment = _SENTIMENT_LABELS[int(post_scores.argmax())]
+            is_negative = bool(post_scores[1] > max(post_scores[0], post_scores[2]))
+        
+        post_sentiment = dict(zip(_SENTIMENT_LABELS, post_scores.tolist()))
         
         logger.debug(f"Comments: {total_comments}, negative: {negative_count} ({negative_percentage:.1%}), "
                     f"post sentiment: {dominant_sentiment}")
         
         return post_sentiment, dominant_sentiment, is_negative
     
-    def analyze_messages_sentiment(self, messages: List[Dict]) -> List[Dict]:
-        """
-        Анализ настроений для всех сообщений и их комментариев.
-        Настроение поста определяется на основе анализа комментариев.
-        """
-        analyzed_messages = []
+    def _analyze_chunk(self, messages: List[Dict], return_arrays: bool = False) -> Iterator[Dict]:
+        """Анализ группы сообщений: комментарии всей группы оцениваются одним пакетным вызовом"""
+        # Список комментариев каждого сообщения берем один раз
+        messages_comments = [message.get('comments') or [] for message in messages]
+        all_comment_texts = [comment['text'] for comments in messages_comments for comment in comments]
+        all_scores = self._score_texts(all_comment_texts)
+        if np.isnan(all_scores).any():
+            raise RuntimeError("Не удалось получить оценки настроений для части комментариев")
         
-        for message in messages:
-            # Анализируем комментарии
-            analyzed_comments = []
-            for comment in message.get('comments', []):
-                comment_sentiment = self.analyze_sentiment(comment['text'])
-                analyzed_comment = {
-                    **comment,
-                    'sentiment': comment_sentiment,
-                    'dominant_sentiment': self.get_dominant_sentiment(comment_sentiment),
-                    'is_negative': self.is_negative(comment_sentiment)
-                }
-                analyzed_comments.append(analyzed_comment)
+        # Доминирующая метка и признак негативности сразу для всех комментариев
+        all_rows = all_scores.tolist()
+        all_dominant = all_scores.argmax(axis=1).tolist()
+        negative_mask = _negative_mask(all_scores)
+        all_negative = negative_mask.tolist()
+        
+        offset = 0
+        
+        for message, comments in zip(messages, messages_comments):
+            end = offset + len(comments)
             
-            # Определяем настроение поста на основе комментариев
-            post_sentiment, dominant_sentiment, is_negative = self.determine_post_sentiment_from_comments(
-                message.get('comments', [])
-            )
+            if not comments:
+                # Без комментариев пост нейтрален, агрегировать нечего
+                analyzed_comments = []
+                post_sentiment = dict(zip(_SENTIMENT_LABELS, _NEUTRAL_SCORES))
+                dominant_sentiment, is_negative = 'neutral', False
+            else:
+                # Анализируем комментарии
+                analyzed_comments = []
+                for k, comment in enumerate(comments, offset):
+                    analyzed_comment = {
+                        **comment,
+                        'sentiment': dict(zip(_SENTIMENT_LABELS, all_rows[k])),
+                        'dominant_sentiment': _SENTIMENT_LABELS[all_dominant[k]],
+                        'is_negative': all_negative[k]
+                    }
+                    analyzed_comments.append(analyzed_comment)
+                
+                # Определяем настроение поста на основе комментариев
+                post_sentiment, dominant_sentiment, is_negative = self._aggregate_post_sentiment(
+                    all_scores[offset:end], negative_mask[offset:end]
+                )
             
             analyzed_message = {
                 **message,
@@ -202,10 +552,61 @@ class SentimentAnalyzer:
                 'comments': analyzed_comments,
             }
             
+            if return_arrays:
+                # Оценки комментариев по столбцам для массовой обработки (перцентили, пороги, Parquet)
+                analyzed_message['_sentiment_block'] = {
+                    'scores': all_scores[offset:end].astype(np.float32),
+                    'neg_mask': negative_mask[offset:end].copy(),
+                }
+            
+            offset = end
+            yield analyzed_message
+    
+    def analyze_messages_sentiment_stream(self, messages: Iterable[Dict], return_arrays: bool = False) -> Iterator[Dict]:
+        """
+        Потоковый анализ настроений: проанализированные сообщения отдаются по мере готовности.
+        
+        Сообщения копятся, пока у них не наберется комментариев на STREAM_BATCHES_PER_CHUNK
+        пакетов модели; затем группа оценивается и отдается целиком. Вызывающий код может
+        обрабатывать готовые сообщения, не дожидаясь оценки остальных.
+        
+        Args:
+            messages: Сообщения с комментариями
+            return_arrays: Добавить к сообщению '_sentiment_block' с массивами оценок комментариев
+                ('scores' - float32 (N, 3) в порядке [positive, negative, neutral], 'neg_mask' - bool (N,))
+        """
+        chunk_target = self.batch_size * self.STREAM_BATCHES_PER_CHUNK
+        chunk = []
+        chunk_comments = 0
+        
+        for message in messages:
+            chunk.append(message)
+            chunk_comments += len(message.get('comments') or ())
+            if chunk_comments >= chunk_target:
+                yield from self._analyze_chunk(chunk, return_arrays)
+                chunk = []
+                chunk_comments = 0
+        
+        if chunk:
+            yield from self._analyze_chunk(chunk, return_arrays)
+    
+    def analyze_messages_sentiment(self, messages: List[Dict], return_arrays: bool = False) -> List[Dict]:
+        """
+        Анализ настроений для всех сообщений и их комментариев.
+        Настроение поста определяется на основе анализа комментариев.
+        
+        Args:
+            messages: Сообщения с комментариями
+            return_arrays: Добавить к сообщениям массивы оценок комментариев
+                (см. analyze_messages_sentiment_stream)
+        """
+        analyzed_messages = []
+        
+        for analyzed_message in self.analyze_messages_sentiment_stream(messages, return_arrays):
             analyzed_messages.append(analyzed_message)
             
             if len(analyzed_messages) % 10 == 0:
-                logger.info(f"Analyzed sentiment for {len(analyzed_messages)} messages")
+                logger.info("Analyzed sentiment for %d messages", len(analyzed_messages))
         
         logger.info(f"Completed sentiment analysis for {len(analyzed_messages)} messages")
         return analyzed_messages 
\ No newline at end of file
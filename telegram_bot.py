@@ -1,29 +1,401 @@
-import json
+import asyncio
+import calendar
+import html
 import os
-import re
-from datetime import datetime, timedelta
-from typing import Set, Dict
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, TypedDict
 import time
+from array import array
+from collections import OrderedDict
+import orjson
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 from telegram.constants import ParseMode
+from telegram.error import RetryAfter
 
 from sentiment_analyzer import SentimentAnalyzer
-from report_generator import ReportGenerator
+from report_generator import ReportGenerator, clean_text_preview
 from telegram_client import TelegramNewsClient
 from config import Config
 from logging_config import LoggingConfig
 
 logger = LoggingConfig.setup_bot_logging()
 
-def clean_text_preview(text: str, max_length: int = 200) -> str:
-    """Очищаем и форматируем текст, удаляя переносы строк и нормализуя пробелы"""
-    if not text:
-        return ""
+# ID отправленных сообщений: массив int64 в машинном порядке байт.
+# JSON-файл прежних версий читается, если двоичного файла еще нет
+SENT_MESSAGES_FILE = 'sent_messages.bin'
+LEGACY_SENT_MESSAGES_FILE = 'sent_messages.json'
+
+# Предел длины одного сообщения (лимит Telegram 4096, оставляем небольшой буфер)
+MAX_MESSAGE_LENGTH = 4000
+
+class DateSelectionState(TypedDict):
+    """Состояние выбора периода в календаре для одного чата"""
+    stage: str  # 'start_date' или 'end_date'
+    start_date: Optional[datetime]
+    end_date: Optional[datetime]
+    current_month: datetime
+
+
+# Шаблоны приветствия и справки; подставляются выбранные каналы и порог негативности
+_WELCOME_TEMPLATE = """
+🤖 **Бот для анализа негативных постов**
+
+📋 Каналы: `{}`
+🎯 Порог негативности: {}%
+
+**Доступные действия:**
+📊 **Анализировать** - анализ сообщений за выбранный период
+📋 **Выбрать каналы** - настроить список каналов для анализа
+
+Выберите действие:
+        """
+
+_HELP_TEMPLATE = """
+🤖 **Команды бота**
+
+**Основные команды:**
+/start - начало работы
+/help - справка бота
+/analyze - анализ сообщений за выбранный период
+
+**Режимы работы:**
+
+📊 **Анализ**
+- Выбор периода:
+• 📅 Сегодня
+• 📆 Вчера  
+• 📊 Последние 7 дней
+• 📈 Последние 30 дней
+• 🔧 Выбрать период
+
+- анализ сообщений за выбранный период
+- поиск негативных постов на основе комментариев
+
+**Конфигурация:**
+- Каналы: `{channel}`
+- Порог негативности: {threshold}%
+        """
+
+# Статические клавиатуры: разметка не меняется, поэтому создается один раз
+_START_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📊 Анализировать", callback_data="analyze_now")],
+    [InlineKeyboardButton("📋 Выбрать каналы", callback_data="select_channels")],
+    [InlineKeyboardButton("ℹ️ Помощь", callback_data="help")]
+])
+
+_DATE_MENU_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📅 Сегодня", callback_data="analyze_today")],
+    [InlineKeyboardButton("📆 Вчера", callback_data="analyze_yesterday")],
+    [InlineKeyboardButton("📊 Последние 7 дней", callback_data="analyze_week")],
+    [InlineKeyboardButton("📈 Последние 30 дней", callback_data="analyze_month")],
+    [InlineKeyboardButton("🔧 Выбрать самостоятельно", callback_data="analyze_custom")]
+])
+
+_HTML_REPORT_MARKUP = InlineKeyboardMarkup([
+    [InlineKeyboardButton("📊 Получить HTML-отчет", callback_data="get_html_report")]
+])
+
+def _period_yesterday(now: datetime):
+    """Вчерашние сутки целиком"""
+    yesterday = now - timedelta(days=1)
+    return (
+        yesterday.replace(hour=0, minute=0, second=0, microsecond=0),
+        yesterday.replace(hour=23, minute=59, second=59, microsecond=999999),
+        "вчера",
+    )
+
+
+# Быстрый выбор периода: опция -> функция от текущего времени,
+# возвращающая (начало, конец, название периода)
+_DATE_OPTIONS = {
+    "today": lambda now: (now.replace(hour=0, minute=0, second=0, microsecond=0), now, "сегодня"),
+    "yesterday": _period_yesterday,
+    "week": lambda now: (now - timedelta(days=7), now, "последние 7 дней"),
+    "month": lambda now: (now - timedelta(days=30), now, "последние 30 дней"),
+}
+
+_MONTH_NAMES = (
+    "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
+    "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"
+)
+
+_DAYS_HEADER = ("Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс")
+
+
+@lru_cache(maxsize=128)
+def _build_calendar(year: int, month: int, today_ordinal: int) -> InlineKeyboardMarkup:
+    """Клавиатура календаря на месяц; дни после today_ordinal недоступны для выбора"""
+    # Создаем календарь для выбранного месяца
+    cal = calendar.monthcalendar(year, month)
+    
+    # Порядковый номер дня перед первым числом месяца
+    month_start = date(year, month, 1).toordinal() - 1
+    
+    # В callback_data одно число: номер месяца для навигации, порядковый номер дня для выбора даты
+    month_index = year * 12 + month - 1
+    
+    keyboard = []
+    
+    # Заголовок с месяцем/годом и навигацией
+    keyboard.append([
+        InlineKeyboardButton("◀", callback_data=f"cal_prev_{month_index}"),
+        InlineKeyboardButton(f"{_MONTH_NAMES[month-1]} {year}", callback_data="cal_ignore"),
+        InlineKeyboardButton("▶", callback_data=f"cal_next_{month_index}")
+    ])
+    
+    keyboard.append([InlineKeyboardButton(day, callback_data="cal_ignore") for day in _DAYS_HEADER])
+    
+    # Дни недели
+    for week in cal:
+        row = []
+        for day in week:
+            # Пустая ячейка; будущие даты не разрешаем
+            if day == 0 or month_start + day > today_ordinal:
+                row.append(InlineKeyboardButton(" ", callback_data="cal_ignore"))
+            else:
+                # Кнопка даты
+                row.append(InlineKeyboardButton(str(day), callback_data=f"cal_date_{month_start + day}"))
+        keyboard.append(row)
+    
+    # Кнопка отмены
+    keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cal_cancel")])
+    
+    return InlineKeyboardMarkup(keyboard)
+
+
+# Карточка негативного поста в сообщении с данными анализа
+_POST_TEMPLATE = """
+{idx}. Пост ID {post_id}
+📅 {post_date}
+📊 Оценка: {negative_score:.3f}
+💬 Комментарии: {negative_comments}/{total_comments} ({negative_comment_percentage:.1f}% нег.)
+👀 Просмотры: {views} | ↗️ Перепосты: {forwards}
+
+📄 {text_preview}
+
+🔗 [Открыть в Telegram]({post_link})
+"""
+
+
+@lru_cache(maxsize=32)
+def _render_json_message(json_path: str, mtime_ns: int, size: int) -> str:
+    """
+    Текст сообщения с данными анализа из JSON-отчета
+    
+    mtime_ns и size входят в ключ кеша: пока файл не менялся,
+    повторная отправка не разбирает JSON и не собирает текст заново.
+    """
+    # Загружаем данные JSON
+    with open(json_path, 'rb') as f:
+        data = orjson.loads(f.read())
+    
+    # Обрабатываем оба формата данных одноканальных и многоканальных
+    if 'channels' in data:  # Multi-channel format
+        metadata = data.get('metadata', {})
+        channels_data = data.get('channels', {})
+        
+        # Создаем полное сообщение с всем содержимым
+        parts = ["📊 Данные анализа\n\n"]
+        parts.append("Метаданные:\n")
+        parts.append("• Проанализировано постов: {}\n".format(metadata.get('total_messages', 0)))
+        parts.append("• Найдено негативных постов: {}\n".format(metadata.get('total_negative', 0)))
+        
+        # Добавляем все посты, сгруппированные по каналам
+        total_negative_posts = sum(len(channel_data.get('negative_posts', [])) for channel_data in channels_data.values())
+        if total_negative_posts > 0:
+            parts.append("\n\nТоп негативных постов:\n")
+            
+            for channel, channel_data in channels_data.items():
+                negative_posts = channel_data.get('negative_posts', [])
+                if not negative_posts:
+                    continue
+                    
+                # Добавляем заголовок канала
+                parts.append(f"\n• Канал: {channel_data.get('channel_title', channel)}\n")
+                
+                # Добавляем топ негативных постов из этого канала
+                for post_idx, post in enumerate(negative_posts, 1):
+                    # Очищаем и форматируем предварительный просмотр текста
+                    text_preview = clean_text_preview(post.get('text', ''), 100)  # Короче для совмещенного сообщения
+                    
+                    post_id = post.get('id', 'N/A')
+                    post_date = post.get('date', 'N/A')
+                    negative_score = post.get('negative_score', 0)
+                    total_comments = post.get('total_comments', 0)
+                    negative_comments = post.get('negative_comments', 0)
+                    negative_comment_percentage = post.get('negative_comment_percentage', 0)
+                    views = post.get('views', 0)
+                    forwards = post.get('forwards', 0)
+                    
+                    # Создаем Telegram-ссылку - извлекаем имя пользователя канала из заголовка канала или используем generic
+                    channel_username = (post.get('channel', channel) or '').lstrip('@')
+                    
+                    post_link = f"https://t.me/{channel_username}/{post_id}" if channel_username else "#"
+                    
+                    # Форматируем пост в компактном стиле с Telegram-ссылкой
+                    parts.append(_POST_TEMPLATE.format_map({
+                        'idx': post_idx,
+                        'post_id': post_id,
+                        'post_date': post_date,
+                        'negative_score': negative_score,
+                        'negative_comments': negative_comments,
+                        'total_comments': total_comments,
+                        'negative_comment_percentage': negative_comment_percentage,
+                        'views': views,
+                        'forwards': forwards,
+                        'text_preview': text_preview,
+                        'post_link': post_link,
+                    }))
+        else:
+            parts.append("\n\n🎉 Негативных постов не найдено!")
+        
+        return ''.join(parts)
+    else:  # Формат одноканальных данных
+        metadata = data.get('metadata', {})
+        negative_posts = data.get('negative_posts', [])
+        
+        # Создаем полное сообщение с всем содержимым
+        parts = ["📊 Данные анализа\n\n"]
+        parts.append("Метаданные:\n")
+        parts.append("• Проанализировано постов: {}\n".format(metadata.get('total_posts_analyzed', 0)))
+        parts.append("• Найдено негативных постов: {}\n".format(metadata.get('negative_posts_found', 0)))
+        parts.append("• Канал: {}\n".format(metadata.get('channel_username', 'Неизвестно')))
+        
+        # Добавляем все посты
+        if negative_posts:
+            parts.append("\n\nТоп негативных постов:\n")
+            
+            for i, post in enumerate(negative_posts[:3], 1):
+                # Очищаем и форматируем предварительный просмотр текста
+                text_preview = clean_text_preview(post.get('text', ''), 100)  # Короче для совмещенного сообщения
+                
+                # Форматируем подробную информацию о посте
+                post_id = post.get('id', 'N/A')
+                post_date = post.get('date', 'N/A')
+                negative_score = post.get('negative_score', 0)
+                total_comments = post.get('total_comments', 0)
+                negative_comments = post.get('negative_comments', 0)
+                negative_comment_percentage = post.get('negative_comment_percentage', 0)
+                views = post.get('views', 0)
+                forwards = post.get('forwards', 0)
+                
+                # Создаем Telegram-ссылку
+                channel_username = (metadata.get('channel_username', '') or '').lstrip('@')
+                
+                post_link = f"https://t.me/{channel_username}/{post_id}" if channel_username else "#"
+                
+                # Форматируем пост в компактном стиле с Telegram-ссылкой
+                parts.append(_POST_TEMPLATE.format_map({
+                    'idx': i,
+                    'post_id': post_id,
+                    'post_date': post_date,
+                    'negative_score': negative_score,
+                    'negative_comments': negative_comments,
+                    'total_comments': total_comments,
+                    'negative_comment_percentage': negative_comment_percentage,
+                    'views': views,
+                    'forwards': forwards,
+                    'text_preview': text_preview,
+                    'post_link': post_link,
+                }))
+        else:
+            parts.append("\n\n🎉 Негативных постов не найдено!")
+        
+        return ''.join(parts)
+
+
+def _build_json_message(json_path: str) -> str:
+    """Текст сообщения с данными анализа (кешируется, пока файл не изменился)"""
+    stat = os.stat(json_path)
+    return _render_json_message(json_path, stat.st_mtime_ns, stat.st_size)
+
+
+class ProgressReporter:
+    """
+    Обновление сообщения о прогрессе с ограничением частоты
+    
+    Промежуточные обновления не чаще одного раза в MIN_INTERVAL секунд:
+    если этап прошел быстрее, его текст откладывается и показывается в конце
+    интервала (отложенный текст заменяется более новым). Текст, совпадающий
+    с уже показанным, не отправляется. Итоговое обновление (force=True)
+    отправляется сразу и отменяет отложенное. Правки сообщения выполняются
+    по очереди под блокировкой, поэтому уже начатая отложенная правка
+    не может перезаписать итоговую.
+    """
+    MIN_INTERVAL = 2.0
     
-    clean_text = text.replace('\n', ' ').replace('\r', ' ').strip()
-    clean_text = re.sub(r'\s+', ' ', clean_text)
-    return clean_text[:max_length] + '...' if len(clean_text) > max_length else clean_text
+    def __init__(self, bot, chat_id: int, message_id: int, text: str):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.last_text = text
+        self.last_edit_ts = time.monotonic()
+        self._pending_text: Optional[str] = None
+        self._pending_parse_mode: Optional[str] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._edit_lock = asyncio.Lock()
+    
+    async def update(self, text: str, parse_mode: Optional[str] = None, force: bool = False,
+                     reply_markup: Optional[InlineKeyboardMarkup] = None) -> bool:
+        """Показать текст; возвращает True, если сообщение было отредактировано сразу"""
+        if force or time.monotonic() - self.last_edit_ts >= self.MIN_INTERVAL:
+            self._cancel_pending()
+            return await self._edit(text, parse_mode, reply_markup)
+        
+        # Слишком рано: запоминаем последний текст и показываем его в конце интервала
+        self._pending_text = None if text == self.last_text else text
+        self._pending_parse_mode = parse_mode
+        if self._pending_text is not None and self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_later())
+        return False
+    
+    async def flush(self) -> bool:
+        """
+        Сразу показать отложенный текст, если он есть
+        
+        Нужно перед синхронными этапами, которые блокируют цикл событий:
+        во время них отложенная отправка выполниться не может.
+        """
+        text, parse_mode = self._pending_text, self._pending_parse_mode
+        self._cancel_pending()
+        if text is None:
+            return False
+        return await self._edit(text, parse_mode)
+    
+    def _cancel_pending(self):
+        """Забыть отложенный текст и отменить его отправку"""
+        self._pending_text = None
+        if self._flush_task is not None:
+            if self._flush_task is not asyncio.current_task():
+                self._flush_task.cancel()
+            self._flush_task = None
+    
+    async def _flush_later(self):
+        """Отправить отложенный текст по окончании интервала"""
+        await asyncio.sleep(max(0.0, self.last_edit_ts + self.MIN_INTERVAL - time.monotonic()))
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.warning("Failed to update progress message: %s", e)
+    
+    async def _edit(self, text: str, parse_mode: Optional[str] = None,
+                    reply_markup: Optional[InlineKeyboardMarkup] = None) -> bool:
+        """Отредактировать сообщение; правки идут строго в порядке вызова"""
+        async with self._edit_lock:
+            if text == self.last_text:
+                return False
+            await self.bot.edit_message_text(
+                chat_id=self.chat_id,
+                message_id=self.message_id,
+                text=text,
+                parse_mode=parse_mode,
+                reply_markup=reply_markup
+            )
+            self.last_text = text
+            self.last_edit_ts = time.monotonic()
+            return True
 
 
 class NegativePostsBot:
@@ -36,16 +408,49 @@ class NegativePostsBot:
         self.report_generator = ReportGenerator()
         
         self.sent_message_ids: Set[int] = set()
+        # ID, добавленные после последнего сохранения: дописываются в конец файла
+        self._unsaved_sent_ids: List[int] = []
+        # Файл нужно переписать целиком (прежний формат или оборванная запись)
+        self._sent_file_needs_rewrite = False
         
         # Последний сгенерированный путь HTML
         self.last_html_path = None
         
+        # Состояние выбора периода в календаре по чатам
+        self.date_selection_state: Dict[int, DateSelectionState] = {}
+        
         # Выбранные каналы для анализа
-        self.selected_channels = Config.get_channels_list()  # Default to all configured channels
+        self.selected_channels = list(Config.get_channels_list())  # Default to all configured channels
+        
+        # Порог негативности в процентах для текстов сообщений
+        self._threshold_pct = Config.NEGATIVE_COMMENT_THRESHOLD * 100
+        
+        # Тексты с выбранными каналами; пересчитываются только при изменении выбора
+        self._refresh_channel_texts()
 
         # Предотвращение дублирования для всех команд и обратных вызовов
-        self.recent_callbacks: Dict[str, float] = {}
-        self.recent_commands: Dict[str, float] = {}  # Отслеживаем все команды
+        # Записи упорядочены по времени последнего вызова: старые всегда в начале
+        self.recent_callbacks: OrderedDict[str, float] = OrderedDict()
+        self.recent_commands: OrderedDict[str, float] = OrderedDict()  # Отслеживаем все команды
+        
+        # Таблицы разбора callback_data кнопок: точные значения (обработчик получает chat_id)
+        # и префиксы (обработчик получает query и остаток строки после префикса).
+        # "analyze_now" есть среди точных значений, поэтому не попадает под префикс "analyze_"
+        self._callback_handlers = {
+            "analyze_now": self._show_date_selection_menu,
+            "select_channels": self._show_channels_selection_menu,
+            "channels_done": self._finish_channel_selection,
+            "help": self._send_help,
+            "get_html_report": self._send_html_report,
+        }
+        self._callback_prefixes = (
+            ("toggle_channel_", lambda query, context, channel:
+                self._toggle_channel_selection(channel, query.message.chat_id, context)),
+            ("analyze_", lambda query, context, date_option:
+                self._handle_date_selection(query.message.chat_id, context, date_option)),
+            ("cal_", lambda query, context, _:
+                self._handle_calendar_callback(query, context)),
+        )
         
         # Загружаем отправленные сообщения из файла, если существует
         self._load_sent_messages()
@@ -63,103 +468,87 @@ class NegativePostsBot:
     def _load_sent_messages(self):
         """Загружаем ранее отправленные сообщения из файла"""
         try:
-            if os.path.exists('sent_messages.json'):
-                with open('sent_messages.json', 'r') as f:
-                    data = json.load(f)
+            if os.path.exists(SENT_MESSAGES_FILE):
+                with open(SENT_MESSAGES_FILE, 'rb') as f:
+                    raw = f.read()
+                ids = array('q')
+                # Неполная запись в конце файла (прерванное сохранение) отбрасывается;
+                # чтобы следующие записи не сдвинулись, файл будет переписан
+                tail = len(raw) % ids.itemsize
+                ids.frombytes(raw[:len(raw) - tail])
+                self.sent_message_ids = set(ids)
+                self._sent_file_needs_rewrite = bool(tail) or len(ids) != len(self.sent_message_ids)
+                logger.info(f"Loaded {len(self.sent_message_ids)} sent message IDs")
+            elif os.path.exists(LEGACY_SENT_MESSAGES_FILE):
+                # Прежний формат JSON; при следующем сохранении будет записан двоичный файл
+                with open(LEGACY_SENT_MESSAGES_FILE, 'rb') as f:
+                    data = orjson.loads(f.read())
                     self.sent_message_ids = set(data.get('sent_ids', []))
                     logger.info(f"Loaded {len(self.sent_message_ids)} sent message IDs")
+                self._sent_file_needs_rewrite = True
         except Exception as e:
             logger.error(f"Error loading sent messages: {e}")
             self.sent_message_ids = set()
     
-    def _save_sent_messages(self):
-        """Сохраняем отправленные сообщения в файл"""
+    def _mark_sent(self, message_id: int) -> bool:
+        """Отметить сообщение как отправленное; False, если оно уже было отмечено"""
+        if message_id in self.sent_message_ids:
+            return False
+        self.sent_message_ids.add(message_id)
+        self._unsaved_sent_ids.append(message_id)
+        return True
+    
+    async def _save_sent_messages(self):
+        """
+        Сохраняем отправленные сообщения в файл (запись выполняется вне цикла событий)
+        
+        Обычно в конец файла дописываются только новые ID; целиком файл
+        переписывается (уплотняется) лишь после миграции, оборванной или неудачной записи.
+        """
+        # Снимок берем в цикле событий, чтобы данные не менялись во время записи
+        if self._sent_file_needs_rewrite:
+            ids, mode = array('q', self.sent_message_ids), 'wb'
+        elif self._unsaved_sent_ids:
+            ids, mode = array('q', self._unsaved_sent_ids), 'ab'
+        else:
+            return
+        self._unsaved_sent_ids = []
+        self._sent_file_needs_rewrite = False
+        
         try:
-            data = {
-                'sent_ids': list(self.sent_message_ids),
-                'last_updated': datetime.now().isoformat()
-            }
-            with open('sent_messages.json', 'w') as f:
-                json.dump(data, f, indent=2)
+            await asyncio.to_thread(self._write_sent_messages, ids, mode)
         except Exception as e:
             logger.error(f"Error saving sent messages: {e}")
+            # Состояние файла неизвестно: при следующем сохранении переписываем его из множества
+            self._sent_file_needs_rewrite = True
+    
+    @staticmethod
+    def _write_sent_messages(ids: array, mode: str = 'wb'):
+        """Блокирующая запись ID отправленных сообщений: 8 байт на ID, без сериализации"""
+        with open(SENT_MESSAGES_FILE, mode) as f:
+            ids.tofile(f)
     
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка команды /start"""
-        chat_id = update.effective_chat.id
-        
-        # Предотвращение дублирования команды /start
-        if self._is_duplicate_command(chat_id, "start"):
-            return
-        
-        keyboard = [
-            [InlineKeyboardButton("📊 Анализировать", callback_data="analyze_now")],
-            [InlineKeyboardButton("📋 Выбрать каналы", callback_data="select_channels")],
-            [InlineKeyboardButton("ℹ️ Помощь", callback_data="help")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        channels_list = self.selected_channels
-        channels_text = ", ".join(channels_list)
-        
-        welcome_text = """
-🤖 **Бот для анализа негативных постов**
-
-📋 Каналы: `{}`
-🎯 Порог негативности: {}%
-
-**Доступные действия:**
-📊 **Анализировать** - анализ сообщений за выбранный период
-📋 **Выбрать каналы** - настроить список каналов для анализа
-
-Выберите действие:
-        """.format(channels_text, Config.NEGATIVE_COMMENT_THRESHOLD * 100)
-        
+        # Ответ дешевый и безопасен при повторе, поэтому проверка на дубликаты не нужна
         await update.message.reply_text(
-            welcome_text,
-            reply_markup=reply_markup,
+            self._welcome_text,
+            reply_markup=_START_MARKUP,
             parse_mode=ParseMode.MARKDOWN
         )
     
+    def _refresh_channel_texts(self):
+        """Пересчитываем тексты, зависящие от выбранных каналов"""
+        self._channels_text = ", ".join(self.selected_channels)
+        self._welcome_text = _WELCOME_TEMPLATE.format(self._channels_text, self._threshold_pct)
+        self._help_text = _HELP_TEMPLATE.format(channel=self.selected_channels, threshold=self._threshold_pct)
+    
     def _get_help_text(self) -> str:
         """Получаем текст справки бота"""
-        return """
-🤖 **Команды бота**
-
-**Основные команды:**
-/start - начало работы
-/help - справка бота
-/analyze - анализ сообщений за выбранный период
-
-**Режимы работы:**
-
-📊 **Анализ**
-- Выбор периода:
-• 📅 Сегодня
-• 📆 Вчера  
-• 📊 Последние 7 дней
-• 📈 Последние 30 дней
-• 🔧 Выбрать период
-
-- анализ сообщений за выбранный период
-- поиск негативных постов на основе комментариев
-
-**Конфигурация:**
-- Каналы: `{channel}`
-- Порог негативности: {threshold}%
-        """.format(
-            channel=self.selected_channels,
-            threshold=Config.NEGATIVE_COMMENT_THRESHOLD * 100
-        )
+        return self._help_text
     
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка команды /help"""
-        chat_id = update.effective_chat.id
-        
-        # Предотвращение дублирования команды /help
-        if self._is_duplicate_command(chat_id, "help"):
-            return
-            
         await update.message.reply_text(self._get_help_text(), parse_mode=ParseMode.MARKDOWN)
     
     async def analyze_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -174,41 +563,41 @@ class NegativePostsBot:
     
     def _is_duplicate_callback(self, callback_key: str, timeout: float = 3.0) -> bool:
         """Проверяем, был ли этот обратный вызов выполнен недавно, чтобы предотвратить дублирование"""
-        current_time = time.time()
+        current_time = time.monotonic()
         
         if callback_key in self.recent_callbacks:
             time_diff = current_time - self.recent_callbacks[callback_key]
             if time_diff < timeout:
-                logger.info(f"Ignoring duplicate callback '{callback_key}' (sent {time_diff:.1f}s ago)")
+                logger.info("Ignoring duplicate callback '%s' (sent %.1fs ago)", callback_key, time_diff)
                 return True
         
         # Обновляем временную метку и очищаем старые записи
-        self.recent_callbacks[callback_key] = current_time
-        self.recent_callbacks = {
-            key: timestamp for key, timestamp in self.recent_callbacks.items()
-            if current_time - timestamp < 10.0
-        }
+        self._touch_recent(self.recent_callbacks, callback_key, current_time)
         return False
 
     def _is_duplicate_command(self, chat_id: int, command: str, timeout: float = 2.0) -> bool:
         """Проверяем, была ли эта команда выполнена недавно, чтобы предотвратить дублирование"""
-        current_time = time.time()
+        current_time = time.monotonic()
         command_key = f"{chat_id}_{command}"
         
         if command_key in self.recent_commands:
             time_diff = current_time - self.recent_commands[command_key]
             if time_diff < timeout:
-                logger.info(f"Ignoring duplicate command '{command}' from {chat_id} (sent {time_diff:.1f}s ago)")
+                logger.info("Ignoring duplicate command '%s' from %s (sent %.1fs ago)", command, chat_id, time_diff)
                 return True
         
         # Обновляем временную метку и очищаем старые записи
-        self.recent_commands[command_key] = current_time
-        self.recent_commands = {
-            key: timestamp for key, timestamp in self.recent_commands.items()
-            if current_time - timestamp < 10.0
-        }
+        self._touch_recent(self.recent_commands, command_key, current_time)
         return False
 
+    @staticmethod
+    def _touch_recent(entries: OrderedDict, key: str, current_time: float, max_age: float = 10.0):
+        """Записать время вызова и удалить записи старше max_age секунд (только из начала очереди)"""
+        entries[key] = current_time
+        entries.move_to_end(key)
+        while entries and current_time - next(iter(entries.values())) >= max_age:
+            entries.popitem(last=False)
+
     async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработка нажатий на кнопки"""
         query = update.callback_query
@@ -227,131 +616,87 @@ class NegativePostsBot:
         if self._is_duplicate_callback(callback_key):
             return
         
-        if query.data == "analyze_now":
-            # Отображаем меню выбора периода
-            await self._show_date_selection_menu(query.message.chat_id, context)
-        
-        elif query.data == "select_channels":
-            # Отображаем меню выбора каналов
-            await self._show_channels_selection_menu(query.message.chat_id, context)
-        
-        elif query.data.startswith("toggle_channel_"):
-            # Переключаем выбор канала
-            channel = query.data.replace("toggle_channel_", "")
-            await self._toggle_channel_selection(channel, query.message.chat_id, context)
+        data = query.data
         
-        elif query.data == "channels_done":
-            # Завершаем выбор канала
-            await self._finish_channel_selection(query.message.chat_id, context)
+        # Точные команды кнопок
+        handler = self._callback_handlers.get(data)
+        if handler is not None:
+            await handler(chat_id, context)
+            return
         
-        elif query.data == "help":
-            # Отправляем справку как новое сообщение
-            await context.bot.send_message(
-                chat_id=query.message.chat_id,
-                text=self._get_help_text(),
-                parse_mode=ParseMode.MARKDOWN
-            )
-            
-        elif query.data == "get_html_report":
-            try:
-                # Используем сохраненный путь HTML-файла
-                if hasattr(self, 'last_html_path') and self.last_html_path:
-                    html_path = self.last_html_path
-                    
-                    # Отправляем HTML-файл только один раз
-                    with open(html_path, 'rb') as f:
-                        await context.bot.send_document(
-                            chat_id=query.message.chat_id,
-                            document=f,
-                            filename=os.path.basename(html_path),
-                            caption="📊 Скачайте и откройте в вашем браузере"
-                        )
-                else:
-                    await context.bot.send_message(
-                        chat_id=query.message.chat_id,
-                        text="❌ HTML-отчет недоступен. Пожалуйста, сначала запустите анализ"
-                    )
+        # Команды с параметром: выбор канала, быстрый выбор даты, календарь
+        for prefix, handler in self._callback_prefixes:
+            if data.startswith(prefix):
+                await handler(query, context, data[len(prefix):])
+                return
+    
+    async def _send_help(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE):
+        """Отправляем справку как новое сообщение"""
+        await context.bot.send_message(
+            chat_id=chat_id,
+            text=self._get_help_text(),
+            parse_mode=ParseMode.MARKDOWN
+        )
+    
+    async def _send_html_report(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE):
+        """Отправляем последний HTML-отчет"""
+        try:
+            # Используем сохраненный путь HTML-файла
+            if self.last_html_path:
+                html_path = self.last_html_path
                 
-            except Exception as e:
+                # Отправляем HTML-файл только один раз
+                with open(html_path, 'rb') as f:
+                    await context.bot.send_document(
+                        chat_id=chat_id,
+                        document=f,
+                        filename=os.path.basename(html_path),
+                        caption="📊 Скачайте и откройте в вашем браузере"
+                    )
+            else:
                 await context.bot.send_message(
-                    chat_id=query.message.chat_id,
-                    text=f"❌ Ошибка отправки HTML-файла: {str(e)}"
+                    chat_id=chat_id,
+                    text="❌ HTML-отчет недоступен. Пожалуйста, сначала запустите анализ"
                 )
-        
-        # Обработка быстрого выбора даты
-        elif query.data.startswith("analyze_"):
-            date_option = query.data.replace("analyze_", "")
-            await self._handle_date_selection(query.message.chat_id, context, date_option)
-        
-        # Обработка взаимодействия с календарем
-        elif query.data.startswith("cal_"):
-            await self._handle_calendar_callback(query, context)
+            
+        except Exception as e:
+            await context.bot.send_message(
+                chat_id=chat_id,
+                text=f"❌ Ошибка отправки HTML-файла: {str(e)}"
+            )
     
     async def _show_date_selection_menu(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE):
         """Отображаем меню выбора даты с быстрыми опциями"""
-        keyboard = [
-            [InlineKeyboardButton("📅 Сегодня", callback_data="analyze_today")],
-            [InlineKeyboardButton("📆 Вчера", callback_data="analyze_yesterday")],
-            [InlineKeyboardButton("📊 Последние 7 дней", callback_data="analyze_week")],
-            [InlineKeyboardButton("📈 Последние 30 дней", callback_data="analyze_month")],
-            [InlineKeyboardButton("🔧 Выбрать самостоятельно", callback_data="analyze_custom")]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
         await context.bot.send_message(
             chat_id=chat_id,
             text="📊 **Выберите период для анализа:**",
-            reply_markup=reply_markup,
+            reply_markup=_DATE_MENU_MARKUP,
             parse_mode=ParseMode.MARKDOWN
         )
     
     async def _handle_date_selection(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE, date_option: str):
         """Обработка выбора даты и запуск анализа"""
-        from datetime import datetime, timedelta
-        
-        now = datetime.now()
+        period = _DATE_OPTIONS.get(date_option)
         
-        if date_option == "today":
-            start_date = now.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_date = now
-            period_name = "сегодня"
-            
-        elif date_option == "yesterday":
-            yesterday = now - timedelta(days=1)
-            start_date = yesterday.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_date = yesterday.replace(hour=23, minute=59, second=59, microsecond=999999)
-            period_name = "вчера"
-            
-        elif date_option == "week":
-            start_date = now - timedelta(days=7)
-            end_date = now
-            period_name = "последние 7 дней"
-            
-        elif date_option == "month":
-            start_date = now - timedelta(days=30)
-            end_date = now
-            period_name = "последние 30 дней"
-            
-        elif date_option == "custom":
-            # Отображаем календарь для выбора даты
-            await self._show_custom_date_selection(chat_id, context)
-            return
-        else:
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text="❌ Некорректный период. Попробуйте еще раз"
-            )
+        if period is None:
+            if date_option == "custom":
+                # Отображаем календарь для выбора даты
+                await self._show_custom_date_selection(chat_id, context)
+            else:
+                await context.bot.send_message(
+                    chat_id=chat_id,
+                    text="❌ Некорректный период. Попробуйте еще раз"
+                )
             return
         
+        start_date, end_date, period_name = period(datetime.now())
+        
         # Запуск анализа с выбранным диапазоном дат
         await self._run_analysis_with_dates(chat_id, context, start_date, end_date, period_name)
     
     async def _show_custom_date_selection(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE):
         """Отображаем интерфейс выбора даты"""
         # Инициализируем состояние выбора даты для этого пользователя
-        if not hasattr(self, 'date_selection_state'):
-            self.date_selection_state = {}
-        
         self.date_selection_state[chat_id] = {
             'stage': 'start_date',
             'start_date': None,
@@ -370,51 +715,8 @@ class NegativePostsBot:
     
     def _create_calendar_keyboard(self, year: int, month: int) -> InlineKeyboardMarkup:
         """Создаем календарь для выбора даты"""
-        import calendar
-        
-        # Создаем календарь для выбранного месяца
-        cal = calendar.monthcalendar(year, month)
-        
-        month_names = [
-            "Январь", "Февраль", "Март", "Апрель", "Май", "Июнь",
-            "Июль", "Август", "Сентябрь", "Октябрь", "Ноябрь", "Декабрь"
-        ]
-        
-        keyboard = []
-        
-        # Заголовок с месяцем/годом и навигацией
-        keyboard.append([
-            InlineKeyboardButton("◀", callback_data=f"cal_prev_{year}_{month}"),
-            InlineKeyboardButton(f"{month_names[month-1]} {year}", callback_data="cal_ignore"),
-            InlineKeyboardButton("▶", callback_data=f"cal_next_{year}_{month}")
-        ])
-        
-        days_header = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
-        keyboard.append([InlineKeyboardButton(day, callback_data="cal_ignore") for day in days_header])
-        
-        # Дни недели
-        for week in cal:
-            row = []
-            for day in week:
-                if day == 0:
-                    # Пустая ячейка
-                    row.append(InlineKeyboardButton(" ", callback_data="cal_ignore"))
-                else:
-                    # Кнопка даты
-                    today = datetime.now()
-                    button_date = datetime(year, month, day)
-                    
-                    # Не разрешаем будущие даты
-                    if button_date > today:
-                        row.append(InlineKeyboardButton(" ", callback_data="cal_ignore"))
-                    else:
-                        row.append(InlineKeyboardButton(str(day), callback_data=f"cal_date_{year}_{month}_{day}"))
-            keyboard.append(row)
-        
-        # Кнопка отмены
-        keyboard.append([InlineKeyboardButton("❌ Отмена", callback_data="cal_cancel")])
-        
-        return InlineKeyboardMarkup(keyboard)
+        # Разметка зависит только от месяца и текущей даты, поэтому берется из кеша
+        return _build_calendar(year, month, datetime.now().toordinal())
     
     async def _show_calendar(self, chat_id: int, context: ContextTypes.DEFAULT_TYPE, date: datetime):
         """Отображаем календарь для выбора даты"""
@@ -442,10 +744,7 @@ class NegativePostsBot:
         chat_id = query.message.chat_id
         data = query.data
         
-        # Инициализируем сессию, если необходимо
-        if not hasattr(self, 'date_selection_state'):
-            self.date_selection_state = {}
-        
+        # Сессия выбора даты должна быть начата через меню периода
         if chat_id not in self.date_selection_state:
             await context.bot.send_message(
                 chat_id=chat_id,
@@ -469,27 +768,11 @@ class NegativePostsBot:
             return
         
         elif data.startswith("cal_prev_") or data.startswith("cal_next_"):
-            # Навигация между месяцами
-            parts = data.split("_")
-            current_year = int(parts[2])
-            current_month = int(parts[3])
-            
-            if data.startswith("cal_prev_"):
-                # Предыдущий месяц
-                if current_month == 1:
-                    new_month = 12
-                    new_year = current_year - 1
-                else:
-                    new_month = current_month - 1
-                    new_year = current_year
-            else:
-                # Следующий месяц
-                if current_month == 12:
-                    new_month = 1
-                    new_year = current_year + 1
-                else:
-                    new_month = current_month + 1
-                    new_year = current_year
+            # Навигация между месяцами: в данных номер текущего месяца (год * 12 + месяц - 1)
+            month_index = int(data[9:])
+            month_index += -1 if data.startswith("cal_prev_") else 1
+            new_year, new_month = divmod(month_index, 12)
+            new_month += 1
             
             # Обновляем текущий месяц
             state['current_month'] = datetime(new_year, new_month, 1)
@@ -503,13 +786,8 @@ class NegativePostsBot:
             )
         
         elif data.startswith("cal_date_"):
-            # Дата выбрана
-            parts = data.split("_")
-            selected_year = int(parts[2])
-            selected_month = int(parts[3])
-            selected_day = int(parts[4])
-            
-            selected_date = datetime(selected_year, selected_month, selected_day)
+            # Дата выбрана; в данных порядковый номер дня
+            selected_date = datetime.fromordinal(int(data[9:]))
             
             if state['stage'] == 'start_date':
                 # Начальная дата выбрана, теперь выбираем конечную дату
@@ -546,11 +824,14 @@ class NegativePostsBot:
                 # Очищаем состояние
                 del self.date_selection_state[chat_id]
                 
+                start_s = start_date.strftime('%d.%m.%Y')
+                end_s = end_date.strftime('%d.%m.%Y')
+                
                 await context.bot.send_message(
                     chat_id=chat_id,
                     text=f"✅ **Период выбран:**\n\n"
-                         f"📅 С: {start_date.strftime('%d.%m.%Y')}\n"
-                         f"📅 По: {end_date.strftime('%d.%m.%Y')}\n\n"
+                         f"📅 С: {start_s}\n"
+                         f"📅 По: {end_s}\n\n"
                          f"🔄 Запускаем анализ...",
                     parse_mode=ParseMode.MARKDOWN
                 )
@@ -558,9 +839,9 @@ class NegativePostsBot:
                 # Рассчитываем название периода
                 days_diff = (end_date - start_date).days + 1
                 if days_diff == 1:
-                    period_name = f"{start_date.strftime('%d.%m.%Y')}"
+                    period_name = start_s
                 else:
-                    period_name = f"{start_date.strftime('%d.%m.%Y')} - {end_date.strftime('%d.%m.%Y')}"
+                    period_name = f"{start_s} - {end_s}"
                 
                 # Запускаем анализ
                 await self._run_analysis_with_dates(chat_id, context, start_date, end_date, period_name)
@@ -575,45 +856,42 @@ class NegativePostsBot:
             logger.info(f"Analysis already running for chat {chat_id}, ignoring duplicate request")
             return
             
+        # Границы периода для текстов о прогрессе
+        start_s = start_date.strftime('%d.%m.%Y')
+        end_s = end_date.strftime('%d.%m.%Y')
+        
         try:
             # Отправляем сообщение о прогрессе
+            progress_text = f"🔄 **Анализ за {period_name}...**"
             progress_msg = await context.bot.send_message(
                 chat_id=chat_id,
-                text=f"🔄 **Анализ за {period_name}...**",
+                text=progress_text,
                 parse_mode=ParseMode.MARKDOWN
             )
+            progress = ProgressReporter(context.bot, chat_id, progress_msg.message_id, progress_text)
 
             # Получаем сообщения за выбранный период из выбранных каналов
+            # Клиент сам ограничивает выборку диапазоном дат
             async with TelegramNewsClient(self.selected_channels) as client:
                 await client.connect()
                 messages_by_channel = await client.get_recent_messages_from_all_channels(
                     limit=Config.MAX_MESSAGES,
-                    days_back=(end_date - start_date).days + 1
+                    start_date=start_date,
+                    end_date=end_date
                 )
 
-            # Фильтруем сообщения по диапазону дат и объединяем все каналы
+            # Объединяем все каналы
             all_messages = []
-            cutoff_start = start_date.replace(tzinfo=None)
-            cutoff_end = end_date.replace(tzinfo=None)
-            
-            for channel_username, messages in messages_by_channel.items():
-                filtered_messages = []
-                for msg in messages:
-                    msg_date = msg['date'].replace(tzinfo=None) if msg['date'].tzinfo else msg['date']
-                    if cutoff_start <= msg_date <= cutoff_end:
-                        filtered_messages.append(msg)
-                
-                messages_by_channel[channel_username] = filtered_messages
-                all_messages.extend(filtered_messages)
+            for messages in messages_by_channel.values():
+                all_messages.extend(messages)
             
             if not all_messages:
-                await context.bot.edit_message_text(
-                    chat_id=chat_id,
-                    message_id=progress_msg.message_id,
-                    text="ℹ️ **Анализ завершен**\n\n"
-                         "📅 Период: {} - {}\n"
-                         "📥 Негативных сообщений не найдено за указанный период".format(start_date.strftime('%d.%m.%Y'), end_date.strftime('%d.%m.%Y')),
-                    parse_mode=ParseMode.MARKDOWN
+                await progress.update(
+                    "ℹ️ **Анализ завершен**\n\n"
+                    "📅 Период: {} - {}\n"
+                    "📥 Негативных сообщений не найдено за указанный период".format(start_s, end_s),
+                    parse_mode=ParseMode.MARKDOWN,
+                    force=True
                 )
                 return
             
@@ -622,95 +900,105 @@ class NegativePostsBot:
             for channel, msgs in messages_by_channel.items():
                 channels_info.append("{}: {}".format(channel, len(msgs)))
             
-            await context.bot.edit_message_text(
-                chat_id=chat_id,
-                message_id=progress_msg.message_id,
-                text="🔄 Анализ за {}...\n\n"
-                     "📅 Период: {} - {}\n"
-                     "📥 Получено {} сообщений\n"
-                     "📋 По каналам: {}\n"
-                     "🔍 Анализируем сентимент...".format(
-                         period_name,
-                         start_date.strftime('%d.%m.%Y'),
-                         end_date.strftime('%d.%m.%Y'),
-                         len(all_messages),
-                         ", ".join(channels_info)
-                     )
+            await progress.update(
+                "🔄 Анализ за {}...\n\n"
+                "📅 Период: {} - {}\n"
+                "📥 Получено {} сообщений\n"
+                "📋 По каналам: {}\n"
+                "🔍 Анализируем сентимент...".format(
+                    period_name,
+                    start_s,
+                    end_s,
+                    len(all_messages),
+                    ", ".join(channels_info)
+                )
             )
 
+            # Анализ синхронный и блокирует цикл событий: показываем статус до него
+            await progress.flush()
+            
             # Анализируем сообщения из всех каналов
             all_messages = self.sentiment_analyzer.analyze_messages_sentiment(all_messages)
 
             # Генерируем многоканальный отчет
-            await context.bot.edit_message_text(
-                chat_id=chat_id,
-                message_id=progress_msg.message_id,
-                text="🔄 Анализ за {}...\n\n"
-                     "📅 Период: {} - {}\n"
-                     "📥 Обработано {} сообщений\n"
-                     "📋 По каналам: {}\n"
-                     "📊 Генерируем отчет...".format(
-                         period_name,
-                         start_date.strftime('%d.%m.%Y'),
-                         end_date.strftime('%d.%m.%Y'),
-                         len(all_messages),
-                         ", ".join(channels_info)
-                     )
+            await progress.update(
+                "🔄 Анализ за {}...\n\n"
+                "📅 Период: {} - {}\n"
+                "📥 Обработано {} сообщений\n"
+                "📋 По каналам: {}\n"
+                "📊 Генерируем отчет...".format(
+                    period_name,
+                    start_s,
+                    end_s,
+                    len(all_messages),
+                    ", ".join(channels_info)
+                )
             )
             
             # Генерируем многоканальный отчет
             report_result = self.report_generator.generate_multichannel_negative_posts_report(all_messages)
 
-            # Завершаем анализ
-            await context.bot.edit_message_text(
-                chat_id=chat_id,
-                message_id=progress_msg.message_id,
-                text="✅ Анализ завершен за {}!\n\n"
-                     "📅 Период: {} - {}\n"
-                     "📥 Обработано {} сообщений\n"
-                     "📋 По каналам: {}\n"
-                     "⚠️ Негативных постов: {}\n"
-                     "📊 Процент негативности: {:.1f}%".format(
-                         period_name,
-                         start_date.strftime('%d.%m.%Y'),
-                         end_date.strftime('%d.%m.%Y'),
-                         report_result['total_messages'],
-                         ", ".join(channels_info),
-                         report_result['total_negative'],
-                         (report_result['total_negative'] / report_result['total_messages'] * 100) if report_result['total_messages'] > 0 else 0
-                     )
+            # Итоговый статус анализа
+            final_text = (
+                "✅ Анализ завершен за {}!\n\n"
+                "📅 Период: {} - {}\n"
+                "📥 Обработано {} сообщений\n"
+                "📋 По каналам: {}\n"
+                "⚠️ Негативных постов: {}\n"
+                "📊 Процент негативности: {:.1f}%".format(
+                    period_name,
+                    start_s,
+                    end_s,
+                    report_result['total_messages'],
+                    ", ".join(channels_info),
+                    report_result['total_negative'],
+                    (report_result['total_negative'] / report_result['total_messages'] * 100) if report_result['total_messages'] > 0 else 0
+                )
             )
             
-            # Сохраняем путь HTML-файла и создаем кнопку
+            # Сохраняем путь HTML-файла для кнопки
             self.last_html_path = report_result.get('html_file', report_result.get('html_path'))
             
-            keyboard = [[InlineKeyboardButton("📊 Получить HTML-отчет", callback_data="get_html_report")]]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-            
             # Генерируем подробную сводку по каналам
             channels_summary = []
             for channel, data in report_result['channels_data'].items():
-                ch_total = len(data['messages'])
+                ch_total = data['total_count']
                 ch_negative = len(data['negative_posts'])
                 ch_pct = (ch_negative / ch_total * 100) if ch_total > 0 else 0
                 channels_summary.append("• {}: {} сообщений, {} негативных ({:.1f}%)".format(
                     data['channel_title'], ch_total, ch_negative, ch_pct
                 ))
+            channels_summary_text = "\n".join(channels_summary)
             
-            summary_text = """
+            # Статус и сводка в одном сообщении, если помещаются: текст экранируется
+            # для HTML, так как имена каналов могут содержать символы разметки
+            merged_text = "{}\n\n📋 <b>Детализация по каналам:</b>\n\n{}".format(
+                html.escape(final_text, quote=False),
+                html.escape(channels_summary_text, quote=False)
+            )
+            if len(merged_text) <= MAX_MESSAGE_LENGTH:
+                await progress.update(
+                    merged_text,
+                    parse_mode=ParseMode.HTML,
+                    force=True,
+                    reply_markup=_HTML_REPORT_MARKUP
+                )
+            else:
+                # Завершаем анализ
+                await progress.update(final_text, force=True)
+                
+                summary_text = """
 📋 **Детализация по каналам:**
 
-{}""".format(
-                "\n".join(channels_summary),
-            )
-            
-            # Отправляем подробную сводку с кнопкой HTML
-            await context.bot.send_message(
-                chat_id=chat_id,
-                text=summary_text,
-                reply_markup=reply_markup,
-                parse_mode=ParseMode.MARKDOWN
-            )
+{}""".format(channels_summary_text)
+                
+                # Отправляем подробную сводку с кнопкой HTML
+                await context.bot.send_message(
+                    chat_id=chat_id,
+                    text=summary_text,
+                    reply_markup=_HTML_REPORT_MARKUP,
+                    parse_mode=ParseMode.MARKDOWN
+                )
 
             # Отправляем форматированные данные JSON как текстовое сообщение
             json_file_path = report_result.get('json_file', report_result.get('json_path'))
@@ -725,47 +1013,67 @@ class NegativePostsBot:
                 parse_mode=ParseMode.MARKDOWN
             )
     
+    async def _send_message_with_retry(self, **kwargs):
+        """
+        send_message с одним повтором после RetryAfter
+        
+        Куски длинного сообщения должны идти по порядку, поэтому отправляются
+        последовательно; при срабатывании ограничения частоты Telegram ждем
+        указанное время вместо того, чтобы терять кусок.
+        """
+        try:
+            return await self.app.bot.send_message(**kwargs)
+        except RetryAfter as e:
+            delay = e.retry_after
+            if isinstance(delay, timedelta):
+                delay = delay.total_seconds()
+            logger.warning("Flood control on chat %s, retrying in %ss", kwargs.get('chat_id'), delay)
+            await asyncio.sleep(delay)
+            return await self.app.bot.send_message(**kwargs)
+    
     async def _send_long_message(self, chat_id: int, message: str):
         """Отправляем длинное сообщение, разделяя его, если необходимо, чтобы соблюсти лимит в 4096 символов Telegram"""
-        MAX_MESSAGE_LENGTH = 4000  # Оставляем небольшой буфер для безопасности
-        
         if len(message) <= MAX_MESSAGE_LENGTH:
             # Сообщение помещается в один кусок
-            await self.app.bot.send_message(
+            await self._send_message_with_retry(
                 chat_id=chat_id,
                 text=message,
                 parse_mode=ParseMode.MARKDOWN,
                 disable_web_page_preview=True
             )
         else:
-            # Нужно разделить сообщение
+            # Нужно разделить сообщение: границы кусков находим по длинам строк,
+            # а каждый кусок собираем одним join
             chunks = []
             lines = message.split('\n')
-            current_chunk = ""
+            start = 0  # Первая строка текущего куска
+            current_len = 0  # Длина текущего куска (0 - кусок пуст)
             
-            for line in lines:
+            for i, line in enumerate(lines):
                 # Проверяем, не превышает ли добавление этой строки лимит
-                if len(current_chunk) + len(line) + 1 > MAX_MESSAGE_LENGTH:
+                if current_len + len(line) + 1 > MAX_MESSAGE_LENGTH:
                     # Сохраняем текущий кусок и начинаем новый
-                    if current_chunk:
-                        chunks.append(current_chunk.strip())
-                    current_chunk = line
-                else:
+                    if current_len:
+                        chunks.append('\n'.join(lines[start:i]).strip())
+                    start = i
+                    current_len = len(line)
+                elif current_len:
                     # Добавляем строку в текущий кусок
-                    if current_chunk:
-                        current_chunk += "\n" + line
-                    else:
-                        current_chunk = line
+                    current_len += len(line) + 1
+                else:
+                    # Пустой кусок начинается с этой строки
+                    start = i
+                    current_len = len(line)
             
             # Добавляем последний кусок
-            if current_chunk:
-                chunks.append(current_chunk.strip())
+            if current_len:
+                chunks.append('\n'.join(lines[start:]).strip())
             
             # Отправляем все куски
             for i, chunk in enumerate(chunks):
                 if i == 0:
                     # Первый кусок - отправляем как есть
-                    await self.app.bot.send_message(
+                    await self._send_message_with_retry(
                         chat_id=chat_id,
                         text=chunk,
                         parse_mode=ParseMode.MARKDOWN,
@@ -773,7 +1081,7 @@ class NegativePostsBot:
                     )
                 else:
                     # Последующие куски - добавляем индикатор продолжения
-                    await self.app.bot.send_message(
+                    await self._send_message_with_retry(
                         chat_id=chat_id,
                         text=f"📄 Продолжение...\n\n{chunk}",
                         parse_mode=ParseMode.MARKDOWN,
@@ -783,129 +1091,11 @@ class NegativePostsBot:
     async def _send_formatted_json_data(self, chat_id: int, json_path: str):
         """Отправляем форматированные данные JSON как читаемое сообщение Telegram"""
         try:
-            # Загружаем данные JSON
-            with open(json_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
+            # Чтение и сборка текста - синхронная работа, выполняем ее вне цикла событий
+            complete_message = await asyncio.to_thread(_build_json_message, json_path)
             
-            # Обрабатываем оба формата данных одноканальных и многоканальных
-            if 'channels' in data:  # Multi-channel format
-                metadata = data.get('metadata', {})
-                channels_data = data.get('channels', {})
-                
-                # Создаем полное сообщение с всем содержимым
-                complete_message = "📊 Данные анализа\n\n"
-                complete_message += "Метаданные:\n"
-                complete_message += "• Проанализировано постов: {}\n".format(metadata.get('total_messages', 0))
-                complete_message += "• Найдено негативных постов: {}\n".format(metadata.get('total_negative', 0))
-                
-                # Добавляем все посты, сгруппированные по каналам
-                total_negative_posts = sum(len(channel_data.get('negative_posts', [])) for channel_data in channels_data.values())
-                if total_negative_posts > 0:
-                    complete_message += "\n\nТоп негативных постов:\n"
-                    
-                    for channel, channel_data in channels_data.items():
-                        negative_posts = channel_data.get('negative_posts', [])
-                        if not negative_posts:
-                            continue
-                            
-                        # Добавляем заголовок канала
-                        complete_message += f"\n• Канал: {channel_data.get('channel_title', channel)}\n"
-                        
-                        # Добавляем топ негативных постов из этого канала
-                        for post_idx, post in enumerate(negative_posts, 1):
-                            # Очищаем и форматируем предварительный просмотр текста
-                            text_preview = clean_text_preview(post.get('text', ''), 100)  # Короче для совмещенного сообщения
-                            
-                            post_id = post.get('id', 'N/A')
-                            post_date = post.get('date', 'N/A')
-                            negative_score = post.get('negative_score', 0)
-                            total_comments = post.get('total_comments', 0)
-                            negative_comments = post.get('negative_comments', 0)
-                            negative_comment_percentage = post.get('negative_comment_percentage', 0)
-                            views = post.get('views', 0)
-                            forwards = post.get('forwards', 0)
-                            
-                            # Создаем Telegram-ссылку - извлекаем имя пользователя канала из заголовка канала или используем generic
-                            channel_username = post.get('channel', channel)
-                            if channel_username.startswith('@'):
-                                channel_username = channel_username[1:]
-                            
-                            post_link = f"https://t.me/{channel_username}/{post_id}" if channel_username else "#"
-                            
-                            # Форматируем пост в компактном стиле с Telegram-ссылкой
-                            complete_message += f"""
-{post_idx}. Пост ID {post_id}
-📅 {post_date}
-📊 Оценка: {negative_score:.3f}
-💬 Комментарии: {negative_comments}/{total_comments} ({negative_comment_percentage:.1f}% нег.)
-👀 Просмотры: {views} | ↗️ Перепосты: {forwards}
-
-📄 {text_preview}
-
-🔗 [Открыть в Telegram]({post_link})
-"""
-                else:
-                    complete_message += "\n\n🎉 Негативных постов не найдено!"
-                
-                # Отправляем полное сообщение как одно, обрабатывая ограничения по длине
-                await self._send_long_message(chat_id, complete_message)
-                
-                return  # Выходим раньше, так как мы отправили все сообщения
-            else:  # Формат одноканальных данных
-                metadata = data.get('metadata', {})
-                negative_posts = data.get('negative_posts', [])
-                
-                # Создаем полное сообщение с всем содержимым
-                complete_message = "📊 Данные анализа\n\n"
-                complete_message += "Метаданные:\n"
-                complete_message += "• Проанализировано постов: {}\n".format(metadata.get('total_posts_analyzed', 0))
-                complete_message += "• Найдено негативных постов: {}\n".format(metadata.get('negative_posts_found', 0))
-                complete_message += "• Канал: {}\n".format(metadata.get('channel_username', 'Неизвестно'))
-                
-                # Добавляем все посты
-                if negative_posts:
-                    complete_message += "\n\nТоп негативных постов:\n"
-                    
-                    for i, post in enumerate(negative_posts[:3], 1):
-                        # Очищаем и форматируем предварительный просмотр текста
-                        text_preview = clean_text_preview(post.get('text', ''), 100)  # Короче для совмещенного сообщения
-                        
-                        # Форматируем подробную информацию о посте
-                        post_id = post.get('id', 'N/A')
-                        post_date = post.get('date', 'N/A')
-                        negative_score = post.get('negative_score', 0)
-                        total_comments = post.get('total_comments', 0)
-                        negative_comments = post.get('negative_comments', 0)
-                        negative_comment_percentage = post.get('negative_comment_percentage', 0)
-                        views = post.get('views', 0)
-                        forwards = post.get('forwards', 0)
-                        
-                        # Создаем Telegram-ссылку
-                        channel_username = metadata.get('channel_username', '')
-                        if channel_username.startswith('@'):
-                            channel_username = channel_username[1:]
-                        
-                        post_link = f"https://t.me/{channel_username}/{post_id}" if channel_username else "#"
-                        
-                        # Форматируем пост в компактном стиле с Telegram-ссылкой
-                        complete_message += f"""
-{i}. Пост ID {post_id}
-📅 {post_date}
-📊 Оценка: {negative_score:.3f}
-💬 Комментарии: {negative_comments}/{total_comments} ({negative_comment_percentage:.1f}% нег.)
-👀 Просмотры: {views} | ↗️ Перепосты: {forwards}
-
-📄 {text_preview}
-
-🔗 [Открыть в Telegram]({post_link})
-"""
-                else:
-                    complete_message += "\n\n🎉 Негативных постов не найдено!"
-                
-                # Отправляем полное сообщение как одно, обрабатывая ограничения по длине
-                await self._send_long_message(chat_id, complete_message)
-                
-                return  # Выходим раньше, так как мы отправили все сообщения
+            # Отправляем полное сообщение как одно, обрабатывая ограничения по длине
+            await self._send_long_message(chat_id, complete_message)
             
         except Exception as e:
             logger.error(f"Error sending formatted JSON: {e}")
@@ -943,7 +1133,7 @@ class NegativePostsBot:
         
         reply_markup = InlineKeyboardMarkup(keyboard)
         
-        selected_text = ", ".join(self.selected_channels) if self.selected_channels else "нет"
+        selected_text = self._channels_text or "нет"
         
         text = """
 📋 **Выбор каналов для анализа**
@@ -964,10 +1154,11 @@ class NegativePostsBot:
         """Переключаем выбор канала"""
         if channel in self.selected_channels:
             self.selected_channels.remove(channel)
-            logger.debug(f"Removed channel: {channel}")
+            logger.debug("Removed channel: %s", channel)
         else:
             self.selected_channels.append(channel)
-            logger.debug(f"Added channel: {channel}")
+            logger.debug("Added channel: %s", channel)
+        self._refresh_channel_texts()
         
         # Обновляем сообщение с новым выбором
         await self._show_channels_selection_menu(chat_id, context)
@@ -981,7 +1172,7 @@ class NegativePostsBot:
             )
             return
         
-        selected_text = ", ".join(self.selected_channels)
+        selected_text = self._channels_text
         
         await context.bot.send_message(
             chat_id=chat_id,
@@ -9,6 +9,15 @@ from logging_config import setup_logger
 
 logger = setup_logger(__name__)
 
+# Локальное время сообщений (UTC+3, Москва)
+LOCAL_TZ = timezone(timedelta(hours=3))
+
+
+def _as_local(value: datetime) -> datetime:
+    """Наивная дата считается локальным (московским) временем"""
+    return value.replace(tzinfo=LOCAL_TZ) if value.tzinfo is None else value
+
+
 class TelegramNewsClient:
     def __init__(self, channels=None):
         self.client = TelegramClient(
@@ -44,31 +53,56 @@ class TelegramNewsClient:
             logger.error("Failed to connect to Telegram: {}".format(e))
             raise
     
-    async def get_recent_messages_from_all_channels(self, limit: int = None, days_back: int = 1) -> Dict[str, List[Dict]]:
-        """Получение последних сообщений из всех каналов с группировкой по каналам"""
+    async def get_recent_messages_from_all_channels(self, limit: int = None, days_back: int = 1,
+                                                    start_date: datetime = None,
+                                                    end_date: datetime = None) -> Dict[str, List[Dict]]:
+        """
+        Получение последних сообщений из всех каналов с группировкой по каналам
+        
+        Если задан диапазон start_date/end_date (наивные даты - московское время),
+        возвращаются только сообщения из него: выборка на сервере начинается
+        с end_date, перебор останавливается на первом сообщении раньше start_date.
+        Иначе берутся сообщения за последние days_back дней.
+        """
         if not self.channel_entities:
             raise ValueError("Не подключен ни к одному каналу. Сначала вызовите connect().")
         
         results = {}
         
+        # Границы диапазона в виде дат с часовым поясом, сравниваются с message.date напрямую
+        if start_date is not None:
+            start_date = _as_local(start_date)
+        offset_date = None
+        if end_date is not None:
+            end_date = _as_local(end_date)
+            # offset_date не включается в выборку и округляется до секунд
+            offset_date = end_date + timedelta(seconds=1)
+        
+        # Без диапазона берем последние days_back дней; message.date приходит в UTC
+        cutoff_date = datetime.now(timezone.utc) - timedelta(days=days_back)
+        
         for channel_username, channel_entity in self.channel_entities.items():
             logger.info("Fetching messages from channel: {}".format(channel_username))
             messages_data = []
             
             try:
-                # Определяем дату начала для фильтрации
-                cutoff_date = datetime.now() - timedelta(days=days_back)
-                
                 async for message in self.client.iter_messages(
                     channel_entity, 
-                    limit=limit
+                    limit=limit,
+                    offset_date=offset_date
                 ):
                     if isinstance(message, MessageService):
                         continue
                     
                     # Фильтрация по дате
-                    if message.date and message.date.replace(tzinfo=None) < cutoff_date:
-                        break
+                    if message.date:
+                        if start_date is not None:
+                            if message.date < start_date:
+                                break
+                        elif message.date < cutoff_date:
+                            break
+                        if end_date is not None and message.date > end_date:
+                            continue
                     
                     # Извлекаем текст из сообщения, обрабатывая медиа сообщения
                     message_text = ''
@@ -87,12 +121,10 @@ class TelegramNewsClient:
                         # If message.date is timezone-aware, convert to local timezone
                         if message_date.tzinfo is not None:
                             # Convert to local timezone (UTC+3 for Moscow time)
-                            local_tz = timezone(timedelta(hours=3))  # Moscow timezone
-                            message_date = message_date.astimezone(local_tz)
+                            message_date = message_date.astimezone(LOCAL_TZ)
                         else:
                             # If no timezone info, assume UTC and convert to local
-                            local_tz = timezone(timedelta(hours=3))  # Moscow timezone
-                            message_date = message_date.replace(tzinfo=timezone.utc).astimezone(local_tz)
+                            message_date = message_date.replace(tzinfo=timezone.utc).astimezone(LOCAL_TZ)
                     
                     message_data = {
                         'id': message.id,
@@ -173,12 +205,10 @@ class TelegramNewsClient:
                     # If comment.date is timezone-aware, convert to local timezone
                     if comment_date.tzinfo is not None:
                         # Convert to local timezone (UTC+3 for Moscow time)
-                        local_tz = timezone(timedelta(hours=3))  # Moscow timezone
-                        comment_date = comment_date.astimezone(local_tz)
+                        comment_date = comment_date.astimezone(LOCAL_TZ)
                     else:
                         # If no timezone info, assume UTC and convert to local
-                        local_tz = timezone(timedelta(hours=3))  # Moscow timezone
-                        comment_date = comment_date.replace(tzinfo=timezone.utc).astimezone(local_tz)
+                        comment_date = comment_date.replace(tzinfo=timezone.utc).astimezone(LOCAL_TZ)
                 
                 comment_data = {
                     'id': comment.id,